@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of format_cineman_content against the original BeautifulSoup implementation, on the saved showtimes page
+of Zurich in benchmarks/fixtures (taken from notebooks/220508_cineman_scraping_chrome.ipynb). Both must produce an
+identical dataframe.
+
+Run from the repository root (needs the packages from requirements.txt):
+    python benchmarks/bench_cineman_parser.py
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import pandas as pd
+from bs4 import BeautifulSoup
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_aws_lambda"))
+import data.cineman_parsing as cp  # noqa: E402
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cineman_showtimes_zurich.html")
+
+
+def is_time_format(input):
+    try:
+        time.strptime(input, '%H:%M')
+        return True
+    except ValueError:
+        return False
+
+
+def old_format_cineman_content(html_content):
+    """
+    The implementation before the optimization, kept here as the baseline.
+    """
+    movies = html_content.find_all("div", {"class": "col-xs-12 col-sm-9"})
+
+    movies_list = []
+    genres_list = []
+    cinemas_list = []
+    places_list = []
+    age_limits = []
+    all_showtimes_lists = []
+    all_languages_lists = []
+
+    for movie in movies:
+        title = movie.find("h4").get_text()
+        movies_list.append(title)
+
+        genre = movie.find("p").get_text()
+        genres_list.append(genre)
+
+        cinemas = movie.find_all("h5")
+        cinema_names = []
+        places = []
+
+        for cinema in cinemas:
+            cinema_name = cinema.find("em").get_text()
+            cinema_names.append(cinema_name)
+            place = cinema.find_all("a")[1].get_text()
+            places.append(place)
+
+        cinemas_list.append(cinema_names)
+        places_list.append(places)
+
+        age_links = movie.find_all("a", {"class": "link"})
+        age_limit = age_links[-1].get_text()
+        if age_limit == "Reservation":
+            age_limit = age_links[-2].get_text()
+        if age_limit.find("Y.") == -1:
+            age_limits.append("unknown")
+        else:
+            age_limits.append(age_limit)
+
+        showtimes_list_div = movie.find("div", {"class": "showtimes-list"})
+        showtimes_string = showtimes_list_div.prettify().split("h5")
+        showtimes_list = []
+        languages_list = []
+
+        for string in showtimes_string:
+            strings = re.sub('<[^<]+?>\n', '', string).split(" ")
+            showtimes = []
+            languages = []
+
+            for s in strings:
+                s = s.strip("<></–)")
+                s = re.sub("\t", "", s)
+                s = s.strip()
+
+                if is_time_format(s):
+                    showtimes.append(s)
+
+                elif (s.find("/") != -1 and s.find("Y.") == -1) or s in ["G", "F", "O", "I", "E"]:
+                    languages.append(s)
+
+            if showtimes:
+                showtimes_list.append(showtimes)
+            if languages:
+                languages_list.append(languages)
+
+        if showtimes_list:
+            all_showtimes_lists.append(showtimes_list)
+        if languages_list:
+            all_languages_lists.append(languages_list)
+
+    all_info_dict = dict()
+
+    all_info_dict["movie"] = movies_list
+    all_info_dict["genre"] = genres_list
+    all_info_dict["age_limit"] = age_limits
+    all_info_dict["language"] = all_languages_lists
+    all_info_dict["showtime"] = all_showtimes_lists
+    all_info_dict["date"] = f'{date.today()}'
+    all_info_dict["cinema"] = cinemas_list
+    all_info_dict["place"] = places_list
+
+    movie_program_df = pd.DataFrame(all_info_dict).explode(["cinema", "showtime", "place", "language"]).explode(
+        ["showtime", "language"]).reset_index(drop=True)
+    movie_program_df["dt_showtime"] = movie_program_df["date"] + " " + movie_program_df["showtime"]
+    movie_program_df["dt_showtime"] = pd.to_datetime(movie_program_df["dt_showtime"], format='%Y-%m-%d %H:%M')
+    movie_program_df["cinema_place"] = [f'{c} {p}' for c, p in
+                                        zip(movie_program_df["cinema"], movie_program_df["place"])]
+
+    return movie_program_df
+
+
+def best_time(func, repeat, **kwargs):
+    """
+    Returns the result of the last call and the fastest of repeat calls, in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(**kwargs)
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        html = f.read()
+
+    # The old scraper handed a BeautifulSoup object to the parser, the new one an lxml tree
+    soup = BeautifulSoup(html, features="lxml")
+    _, soup_time = best_time(BeautifulSoup, args.repeat, markup=html, features="lxml")
+    _, tree_time = best_time(cp.parse_html, args.repeat, html_content=html)
+    tree = cp.parse_html(html)
+
+    old_df, old_time = best_time(old_format_cineman_content, args.repeat, html_content=soup)
+    new_df, new_time = best_time(cp.format_cineman_content, args.repeat, html_content=tree)
+    _, new_html_time = best_time(cp.format_cineman_content, args.repeat, html_content=html)
+    pd.testing.assert_frame_equal(old_df, new_df)
+
+    print(f"{len(new_df)} rows, identical dataframes")
+    print(f"parsing the page:      BeautifulSoup {soup_time:.3f}s, lxml {tree_time:.3f}s")
+    print(f"format_cineman_content: old {old_time:.3f}s, new {new_time:.3f}s ({old_time / new_time:.1f}x)")
+    print(f"from the html string:  old {soup_time + old_time:.3f}s, new {new_html_time:.3f}s "
+          f"({(soup_time + old_time) / new_html_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Microbenchmark of the batched recommender (recommend_recent_movies) against the original recent_movie_recommender,
+which sorted a whole row of the dense N x N similarity matrix for every query.
+
+Run from the repository root (needs the packages from requirements.txt):
+    python benchmarks/bench_recommender.py
+    python benchmarks/bench_recommender.py --num-docs 8000 --num-recent 80 --num-queries 200
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_aws_lambda"))
+import models.reco_functions as rf  # noqa: E402
+
+
+def old_recent_movie_recommender(movie_title, all_movies_desc, recent_movies_desc, similarities_df):
+    """
+    The implementation before the vectorization, kept here as the baseline.
+    """
+    all_movies = all_movies_desc['original_title'].values
+    recent_movies = recent_movies_desc["original_title"].values
+    recent_movie_idx = all_movies_desc[all_movies_desc["original_title"].isin(recent_movies)].index
+    movie_idx = np.where(all_movies == movie_title)[0][0]
+    movie_similarities = similarities_df.iloc[movie_idx].values
+    similar_movies = np.argsort(-movie_similarities)
+    similar_recent_movies = [index for index in similar_movies if index in recent_movie_idx]
+    movie_rec = all_movies[similar_recent_movies][0]
+    if movie_rec == movie_title:
+        movie_rec = all_movies[similar_recent_movies][1]
+    return movie_rec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-docs", type=int, default=5000)
+    parser.add_argument("--num-recent", type=int, default=50)
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--num-features", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    document_vectors = rng.standard_normal((args.num_docs, args.num_features))
+    all_movies_desc = pd.DataFrame({"original_title": [f"movie {i}" for i in range(args.num_docs)]})
+    recent_movies_desc = all_movies_desc.sample(args.num_recent, random_state=0)
+    # Queries include some recent movies, which must not be recommended to themselves
+    query_titles = list(all_movies_desc["original_title"].sample(args.num_queries - 10, random_state=1)) + \
+        list(recent_movies_desc["original_title"][:10])
+
+    # The old recommender needed the full similarity matrix, which the app computed when it started
+    start = time.perf_counter()
+    similarities_df = pd.DataFrame(cosine_similarity(document_vectors))
+    matrix_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    old_recs = [old_recent_movie_recommender(movie_title=title, all_movies_desc=all_movies_desc,
+                                             recent_movies_desc=recent_movies_desc, similarities_df=similarities_df)
+                for title in query_titles]
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single_recs = [rf.recommend_recent_movies(movie_titles=[title], all_movies_desc=all_movies_desc,
+                                              recent_movies_desc=recent_movies_desc,
+                                              document_vectors=document_vectors, k=1)[0]
+                   for title in query_titles]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_recs = rf.recommend_recent_movies(movie_titles=query_titles, all_movies_desc=all_movies_desc,
+                                            recent_movies_desc=recent_movies_desc, document_vectors=document_vectors,
+                                            k=3)
+    batch_time = time.perf_counter() - start
+
+    same_single = all(old == recs[0][0] for old, recs in zip(old_recs, single_recs))
+    same_batch = all(old == recs[0][0] for old, recs in zip(old_recs, batch_recs))
+    num_queries = len(query_titles)
+    print(f"{args.num_docs} documents, {args.num_recent} recent movies, {num_queries} queries")
+    print(f"similarity matrix for the old recommender: {matrix_time:.2f}s")
+    print(f"old, one query at a time:   {old_time / num_queries * 1000:8.2f} ms per query")
+    print(f"new, one query at a time:   {single_time / num_queries * 1000:8.2f} ms per query "
+          f"({old_time / single_time:.1f}x), same top recommendation: {same_single}")
+    print(f"new, all queries as a batch: {batch_time / num_queries * 1000:8.2f} ms per query "
+          f"({old_time / batch_time:.1f}x, top 3 each), same top recommendation: {same_batch}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark of averaged_word2vec_vectorizer against the original per-token implementation, on random corpora of 5k,
+50k and 500k documents.
+
+Run from the repository root (needs the packages from requirements.txt):
+    python benchmarks/bench_vectorizer.py
+    python benchmarks/bench_vectorizer.py --sizes 5000 50000 --skip-old-above 50000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from gensim.models import KeyedVectors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_aws_lambda"))
+import models.reco_functions as rf  # noqa: E402
+
+
+class WordVectorModel:
+    """
+    Stand-in for a trained FastText model: the vectorizers only use its wv attribute.
+    """
+    def __init__(self, wv):
+        self.wv = wv
+
+
+def old_averaged_word2vec_vectorizer(corpus, model, num_features):
+    """
+    The implementation before the vectorization, kept here as the baseline.
+    """
+    model_vocab = set(model.wv.index_to_key)
+
+    def average_word_vectors(words, model, vocabulary, num_features):
+        feature_vector = np.zeros((num_features,), dtype="float64")
+        nwords = 0.
+
+        for word in words:
+            if word in vocabulary:
+                nwords = nwords + 1.
+                feature_vector = np.add(feature_vector, model.wv[word])
+        if nwords:
+            feature_vector = np.divide(feature_vector, nwords)
+
+        return feature_vector
+
+    features = [average_word_vectors(words=tokenized_sentence, model=model,
+                                     vocabulary=model_vocab, num_features=num_features)
+                for tokenized_sentence in corpus]
+
+    return np.array(features)
+
+
+def make_corpus(num_docs, vocab, rng, mean_length=60, oov_share=0.1):
+    """
+    This function creates random tokenized documents from the vocabulary, with a share of out-of-vocabulary tokens.
+    """
+    lengths = rng.poisson(mean_length, size=num_docs)
+    tokens = rng.choice(vocab, size=lengths.sum())
+    oov = rng.random(len(tokens)) < oov_share
+    tokens = np.where(oov, "unknownword", tokens).tolist()
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    return [tokens[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def time_call(func, **kwargs):
+    start = time.perf_counter()
+    result = func(**kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000, 500000])
+    parser.add_argument("--vocab-size", type=int, default=20000)
+    parser.add_argument("--num-features", type=int, default=300)
+    parser.add_argument("--skip-old-above", type=int, default=None,
+                        help="don't run the (slow) baseline for corpora larger than this")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocab = np.array([f"word{i}" for i in range(args.vocab_size)])
+    wv = KeyedVectors(vector_size=args.num_features)
+    wv.add_vectors(list(vocab), rng.standard_normal((args.vocab_size, args.num_features)).astype("float32"))
+    model = WordVectorModel(wv)
+
+    print(f"{'documents':>10} {'old (s)':>10} {'new (s)':>10} {'float32 (s)':>12} {'speedup':>8} {'identical':>10}")
+    for num_docs in args.sizes:
+        corpus = make_corpus(num_docs, vocab, rng)
+        new, new_time = time_call(rf.averaged_word2vec_vectorizer, corpus=corpus, model=model,
+                                  num_features=args.num_features)
+        _, new32_time = time_call(rf.averaged_word2vec_vectorizer, corpus=corpus, model=model,
+                                  num_features=args.num_features, dtype="float32")
+        if args.skip_old_above is not None and num_docs > args.skip_old_above:
+            print(f"{num_docs:>10} {'-':>10} {new_time:>10.2f} {new32_time:>12.2f} {'-':>8} {'-':>10}")
+            continue
+        old, old_time = time_call(old_averaged_word2vec_vectorizer, corpus=corpus, model=model,
+                                  num_features=args.num_features)
+        identical = np.allclose(old, new, rtol=1e-6, atol=1e-6)
+        print(f"{num_docs:>10} {old_time:>10.2f} {new_time:>10.2f} {new32_time:>12.2f} {old_time / new_time:>7.1f}x "
+              f"{str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Round-trip check of save_ft_model and load_ft_model: a small model is saved into an in-memory filesystem, which
+behaves like the s3fs bucket, loaded back and compared with the original, then trained further as retrain_ft_model
+does on the daily runs.
+
+Run from the repository root (needs the packages from requirements.txt):
+    python benchmarks/check_ft_model_roundtrip.py
+"""
+import os
+import sys
+import numpy as np
+import fsspec
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_aws_lambda"))
+import models.reco_functions as rf  # noqa: E402
+
+
+def main():
+    fs = fsspec.filesystem("memory")
+    models_path = "memory://models"
+    docs = ["a detective hunts a killer through the rainy city",
+            "two friends travel across the desert to find a lost city",
+            "a young wizard learns magic at a school for wizards",
+            "a killer robot travels back in time to hunt a young woman"] * 5
+    tokenized_docs, ft_model = rf.train_ft_model(docs)
+    state = {"last_full_train": "2021-12-01", "doc_hashes": ["hash"]}
+
+    assert rf.load_ft_model(fs=fs, models_path=models_path) == (None, None)
+    rf.save_ft_model(fs=fs, models_path=models_path, ft_model=ft_model, state=state)
+    loaded_model, loaded_state = rf.load_ft_model(fs=fs, models_path=models_path)
+
+    assert loaded_state == state
+    assert loaded_model.wv.index_to_key == ft_model.wv.index_to_key
+    assert np.array_equal(loaded_model.wv.vectors, ft_model.wv.vectors)
+    assert np.array_equal(loaded_model.wv["unseenword"], ft_model.wv["unseenword"])
+    rf.update_ft_model(ft_model=loaded_model, new_tokenized_docs=[["a", "new", "heist", "movie"]] * 3)
+    assert "heist" in loaded_model.wv.key_to_index
+    print("save_ft_model -> load_ft_model round trip: ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Check of update_neighbour_index against build_neighbour_index: several days are simulated on random document vectors,
+with titles leaving and joining the corpus and the set of recent movies (the neighbour candidates) rotating. Every
+day the updated index is saved into an in-memory filesystem, which behaves like the s3fs bucket, and compared with
+the index computed from scratch.
+
+Run from the repository root (needs the packages from requirements.txt):
+    python benchmarks/check_neighbour_index_update.py
+    python benchmarks/check_neighbour_index_update.py --num-docs 2000 --num-recent 60 --days 10
+"""
+import os
+import sys
+import argparse
+import numpy as np
+import fsspec
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_aws_lambda"))
+import models.reco_functions as rf  # noqa: E402
+
+
+class DocumentModel:
+    """
+    Stand-in for a trained FastText model: every document is a single token with its own random vector.
+    """
+    def __init__(self, num_docs, num_features, rng):
+        self.wv = type("WordVectors", (), {})()
+        self.wv.index_to_key = [f"doc{i}" for i in range(num_docs)]
+        self.wv.key_to_index = {key: i for i, key in enumerate(self.wv.index_to_key)}
+        self.wv.vectors = rng.standard_normal((num_docs, num_features)).astype("float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-docs", type=int, default=303)
+    parser.add_argument("--num-recent", type=int, default=30)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--num-features", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    fs = fsspec.filesystem("memory")
+    models_path = "memory://models"
+    model = DocumentModel(args.num_docs + args.days * 10, args.num_features, rng)
+    corpus = list(range(args.num_docs))
+    recent = set(rng.choice(corpus, args.num_recent, replace=False).tolist())
+
+    for day in range(args.days):
+        if day:
+            # Some titles leave the corpus, new ones join, and a few recent movies are replaced by others
+            corpus = sorted(rng.choice(corpus, len(corpus) - 10, replace=False).tolist() +
+                            list(range(args.num_docs + (day - 1) * 10, args.num_docs + day * 10)))
+            recent = set(rng.choice(sorted(recent.intersection(corpus)), args.num_recent - 10, replace=False).tolist())
+            recent.update(rng.choice(sorted(set(corpus) - recent), args.num_recent - len(recent),
+                                     replace=False).tolist())
+        titles = [f"movie {i}" for i in corpus]
+        tokenized_docs = [[f"doc{i}"] for i in corpus]
+        candidate_idx = np.array([row for row, i in enumerate(corpus) if i in recent])
+
+        document_vectors, neighbour_idx, neighbour_sims, doc_hashes, num_embedded = rf.update_neighbour_index(
+            fs=fs, models_path=models_path, titles=titles, tokenized_docs=tokenized_docs, model=model,
+            num_features=args.num_features, candidate_idx=candidate_idx, k=args.k)
+        exact_idx, exact_sims = rf.build_neighbour_index(document_vectors=document_vectors, k=args.k,
+                                                         candidate_idx=candidate_idx)
+        rf.save_model_artifacts(fs=fs, models_path=models_path, titles=titles, document_vectors=document_vectors,
+                                neighbour_idx=neighbour_idx, neighbour_sims=neighbour_sims, doc_hashes=doc_hashes,
+                                candidate_idx=candidate_idx)
+
+        wrong_top = (neighbour_idx[:, 0] != exact_idx[:, 0]).sum()
+        wrong_rows = (neighbour_idx != exact_idx).any(axis=1).sum()
+        max_sim_error = np.abs(neighbour_sims - exact_sims).max()
+        print(f"day {day + 1}: {num_embedded} documents embedded, {wrong_top} rows with a wrong top neighbour, "
+              f"{wrong_rows} rows with a wrong list, largest similarity error {max_sim_error:.1e}")
+        assert not wrong_rows
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+from lxml import etree
+import pandas as pd
+from datetime import date
+import re
+
+
+# Compiled XPath queries for the parts of the showtimes page that are read
+MOVIE_XPATH = etree.XPath('//div[normalize-space(@class)="col-xs-12 col-sm-9"]')
+SHOWTIMES_LIST_XPATH = etree.XPath('.//div[contains(concat(" ", normalize-space(@class), " "), " showtimes-list ")]')
+TEXT_XPATH = etree.XPath("string()", smart_strings=False)
+
+# Elements whose text isn't part of the visible page
+SKIPPED_TEXT_TAGS = frozenset(["script", "style", "template"])
+
+# Same times as time.strptime(s, '%H:%M') accepts, and the single letter language codes used by cineman.ch
+TIME_PATTERN = re.compile(r"(?:2[0-3]|[0-1][0-9]|[0-9]):(?:[0-5][0-9]|[0-9])")
+LANGUAGE_CODES = frozenset(["G", "F", "O", "I", "E"])
+TOKEN_STRIP_CHARS = "<></–)"
+
+
+def is_time_format(str_input):
+    return TIME_PATTERN.fullmatch(str_input) is not None
+
+
+def parse_html(html_content):
+    """
+    Returns the lxml tree of a page given as html string, lxml element or BeautifulSoup object.
+    """
+    if isinstance(html_content, etree._Element):
+        return html_content
+    return etree.HTML(str(html_content))
+
+
+def element_text(element, tag):
+    """
+    Returns the text of the first element with the given tag below element, like BeautifulSoup's find().get_text().
+    """
+    return TEXT_XPATH(next(element.iterdescendants(tag)))
+
+
+def has_class(element, class_name):
+    return class_name in (element.get("class") or "").split()
+
+
+def add_tokens(text, showtimes, languages):
+    """
+    Splits a text of a showtimes div into tokens and adds the showtimes and the language codes among them to the
+    lists.
+    """
+    if not text or text.isspace():
+        return
+    for s in text.strip().split(" "):
+        s = s.strip(TOKEN_STRIP_CHARS).replace("\t", "").strip()
+        if TIME_PATTERN.fullmatch(s):
+            showtimes.append(s)
+        elif ("/" in s and "Y." not in s) or s in LANGUAGE_CODES:
+            languages.append(s)
+
+
+def parse_showtimes(showtimes_list_div):
+    """
+    This function walks once over the text of a showtimes div and collects the showtimes and language codes,
+    grouped by the cinema heading (h5) that precedes them. Groups without any showtimes or languages are left out.
+
+    Required arguments:
+    - showtimes_list_div: lxml element of the showtimes-list div of one movie
+
+    Returns:
+    - showtimes_list: list of lists of strings, the showtimes per cinema
+    - languages_list: list of lists of strings, the language codes per cinema
+    """
+    showtimes_list = []
+    languages_list = []
+    showtimes = []
+    languages = []
+
+    # The texts are visited in document order: the text of an element when it starts, its tail when it ends
+    for event, element in etree.iterwalk(showtimes_list_div, events=("start", "end")):
+        if event == "start":
+            if element.tag == "h5":
+                if showtimes:
+                    showtimes_list.append(showtimes)
+                if languages:
+                    languages_list.append(languages)
+                showtimes = []
+                languages = []
+            # Comments have a function as tag, their text is skipped as well
+            if isinstance(element.tag, str) and element.tag not in SKIPPED_TEXT_TAGS:
+                add_tokens(element.text, showtimes, languages)
+        elif element is not showtimes_list_div:
+            add_tokens(element.tail, showtimes, languages)
+
+    if showtimes:
+        showtimes_list.append(showtimes)
+    if languages:
+        languages_list.append(languages)
+
+    return showtimes_list, languages_list
+
+
+def format_cineman_content(html_content):
+    """
+    This function takes in content scraped from cineman.ch and creates a dataframe from it.
+    The page is read with lxml, the showtimes of every movie are read in a single pass over its elements and the
+    rows are collected in column lists directly, so no exploding of nested lists is necessary.
+
+    Required arguments:
+    - content: html contents scraped from cineman.ch, as lxml tree, html string or BeautifulSoup object
+
+    Returns:
+    - movie_program_df: pandas dataframe containing the scraped data
+    """
+    html_content = parse_html(html_content)
+
+    # Initialize the columns, with one entry per movie screening
+    columns = {"movie": [], "genre": [], "age_limit": [], "language": [], "showtime": [], "cinema": [], "place": []}
+
+    for movie in MOVIE_XPATH(html_content):
+        # Movie title and genre
+        title = element_text(movie, "h4")
+        genre = element_text(movie, "p")
+
+        # Cinemas and place
+        cinema_names = []
+        places = []
+        for cinema in movie.iterdescendants("h5"):
+            cinema_names.append(element_text(cinema, "em"))
+            places.append(TEXT_XPATH(list(cinema.iterdescendants("a"))[1]))
+
+        # Age limit
+        age_links = [link for link in movie.iterdescendants("a") if has_class(link, "link")]
+        age_limit = TEXT_XPATH(age_links[-1])
+        if age_limit == "Reservation":
+            age_limit = TEXT_XPATH(age_links[-2])
+        if age_limit.find("Y.") == -1:
+            age_limit = "unknown"
+
+        # Showtimes and languages, one group for each cinema heading
+        showtimes_list_div = next(div for div in movie.iterdescendants("div") if has_class(div, "showtimes-list"))
+        showtimes_list, languages_list = parse_showtimes(showtimes_list_div)
+
+        if len(showtimes_list) != len(cinema_names) or len(languages_list) != len(cinema_names):
+            raise ValueError(f"Cinemas, showtimes and languages of '{title}' don't match")
+
+        for cinema_name, place, showtimes, languages in zip(cinema_names, places, showtimes_list, languages_list):
+            if len(showtimes) != len(languages):
+                raise ValueError(f"Showtimes and languages of '{title}' in {cinema_name} don't match")
+            for showtime, language in zip(showtimes, languages):
+                columns["movie"].append(title)
+                columns["genre"].append(genre)
+                columns["age_limit"].append(age_limit)
+                columns["language"].append(language)
+                columns["showtime"].append(showtime)
+                columns["cinema"].append(cinema_name)
+                columns["place"].append(place)
+
+    today = f'{date.today()}'
+    movie_program_df = pd.DataFrame({
+        "movie": columns["movie"],
+        "genre": columns["genre"],
+        "age_limit": columns["age_limit"],
+        "language": columns["language"],
+        "showtime": columns["showtime"],
+        "date": [today] * len(columns["movie"]),
+        "cinema": columns["cinema"],
+        "place": columns["place"]
+    }, dtype=object)
+    movie_program_df["dt_showtime"] = pd.to_datetime(movie_program_df["date"] + " " + movie_program_df["showtime"],
+                                                     format='%Y-%m-%d %H:%M')
+    movie_program_df["cinema_place"] = [f'{c} {p}' for c, p in
+                                        zip(movie_program_df["cinema"], movie_program_df["place"])]
+
+    return movie_program_df
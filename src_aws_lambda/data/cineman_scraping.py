@@ -1,177 +1,75 @@
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from bs4 import BeautifulSoup
-import pandas as pd
-import time
-from datetime import date
-import re
+from lxml import etree
 #from pyvirtualdisplay import Display
 
-
-def is_time_format(str_input):
-    try:
-        time.strptime(str_input, '%H:%M')
-        return True
-    except ValueError:
-        return False
+from .selenium_waits import STEP_TIMEOUTS, SHOWTIMES_LOCATOR, wait_for, page_is_idle, click_when_unobstructed, \
+    showtimes_populated, is_stale
+from .cineman_parsing import format_cineman_content  # noqa: F401 (used by callers of this module)
 
 
-def scrape_cineman(cities=("Zürich")):
+def scrape_cineman(cities=("Zürich",), timeouts=None):
     """
     This function opens a Selenium driver, goes to the cineman.ch Showtimes page.
-    Then it scrapes the entries for a specified city.
+    Then it scrapes the entries for a specified city. Instead of sleeping for fixed amounts of time, every step waits
+    for the page to be ready and logs how long that took.
 
     Optional argument:
-    - cities: tuple of strings, specifies the cities for which showtimes will be scraped, defaults to ('Zürich')
+    - cities: tuple of strings, specifies the cities for which showtimes will be scraped, defaults to ('Zürich',)
+    - timeouts: dictionary, maximum number of seconds per step, overrides the defaults in STEP_TIMEOUTS
 
     Returns:
-    - content: html code of the page scraped with BeautifulSoup
+    - content: lxml tree of the scraped page
     """
+    if isinstance(cities, str):
+        cities = (cities,)
+    timeouts = {**STEP_TIMEOUTS, **(timeouts or {})}
+
     # Open the driver and go to the page with the showtimes
-  #  display = Display(visible=0, size=(800, 600))
-  #  display.start()
     options = FirefoxOptions()
     options.add_argument("--headless")
     driver = webdriver.Firefox(options=options)
     driver.get("https://www.cineman.ch/en/showtimes/city/")
-    time.sleep(20)  # have to wait for the advertisement to end
 
-    # Click the cookie button
-    cookie_button = driver.find_element_by_class_name("cc-btn")
-    cookie_button.click()
-    time.sleep(10)
-
-    # Sort the showtimes by time
-    sorting_buttons = driver.find_elements_by_class_name("text-overflow-hidden")
-    sorting_buttons[2].click()
-
-    # Click the region dropdown, select the city and save
-    region_dropdown = driver.find_element_by_class_name("selectize-control")
-    region_dropdown.click()
+    try:
+        wait_for(driver, page_is_idle, "page load", timeouts["page load"])
 
-    input_div = driver.find_elements_by_xpath('//input[@type="text"]')
-    for city in cities:
-        input_div[6].send_keys(city)
-        input_div[6].send_keys(Keys.RETURN)
+        # Click the cookie button as soon as the advertisement doesn't cover it anymore
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "cc-btn")), "cookie button",
+                 timeouts["cookie button"])
 
-    save_button = driver.find_element_by_class_name("select-region-save")
-    save_button.click()
+        # Sort the showtimes by time
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "text-overflow-hidden"), index=2), "sort button",
+                 timeouts["sort button"])
 
-    # Scrape the content and close the driver
-    content = BeautifulSoup(driver.page_source, features="html.parser")
-    driver.close()
+        # Click the region dropdown, select the city and save
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "selectize-control")), "region dropdown",
+                 timeouts["region dropdown"])
 
-    return content
+        input_div = driver.find_elements_by_xpath('//input[@type="text"]')
+        for city in cities:
+            input_div[6].send_keys(city)
+            input_div[6].send_keys(Keys.RETURN)
 
+        old_showtimes = driver.find_elements(*SHOWTIMES_LOCATOR)
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "select-region-save")), "save button",
+                 timeouts["save button"])
 
-def format_cineman_content(html_content):
-    """
-    This function takes in content scraped from cineman.ch with BeautifulSoup and creates a dataframe from it.
+        # Wait for the showtimes of the selected region to replace the old ones
+        if old_showtimes:
+            wait_for(driver, is_stale(old_showtimes[0]), "showtimes refresh", timeouts["showtimes refresh"],
+                     required=False)
+        wait_for(driver, page_is_idle, "network idle", timeouts["network idle"])
+        wait_for(driver, showtimes_populated, "showtimes", timeouts["showtimes"])
 
-    Required arguments:
-    - content: html contents scraped from cineman.ch
+        # Scrape the content
+        content = etree.HTML(driver.page_source)
+    finally:
+        driver.quit()
 
-    Returns:
-    - movie_program_df: pandas dataframe containing the scraped data
-    """
-    movies = html_content.findAll("div", {"class": "col-xs-12 col-sm-9"})
-
-    # Now create the data frame
-    # Initialize the lists to store the details for each movie screening
-    movies_list = []
-    genres_list = []
-    cinemas_list = []
-    places_list = []
-    age_limits = []
-    all_showtimes_lists = []
-    all_languages_lists = []
-
-    for movie in movies:
-        # Movie title
-        title = movie.find("h4").get_text()
-        movies_list.append(title)
-
-        # Movie genre
-        genre = movie.find("p").get_text()
-        genres_list.append(genre)
-
-        # Cinemas and place
-        cinemas = movie.findAll("h5")
-        cinema_names = []
-        places = []
-
-        for cinema in cinemas:
-            cinema_name = cinema.find("em").get_text()
-            cinema_names.append(cinema_name)
-            place = cinema.findAll("a")[1].get_text()
-            places.append(place)
-
-        cinemas_list.append(cinema_names)
-        places_list.append(places)
-
-        # Age limit
-        age_links = movie.findAll("a", {"class": "link"})
-        age_limit = age_links[-1].get_text()
-        if age_limit == "Reservation":
-            age_limit = age_links[-2].get_text()
-        if age_limit.find("Y.") == -1:
-            age_limits.append("unknown")
-        else:
-            age_limits.append(age_limit)
-
-        # Showtimes and languages
-        showtimes_list_div = movie.find("div", {"class": "showtimes-list"})
-        showtimes_string = showtimes_list_div.prettify().split("h5")
-        showtimes_list = []
-        languages_list = []
-
-        for string in showtimes_string:
-            strings = re.sub('<[^<]+?>\n', '', string).split(" ")
-            showtimes = []
-            languages = []
-
-            for s in strings:
-                s = s.strip("<></–)")
-                s = re.sub("\t", "", s)
-                s = s.strip()
-
-                if is_time_format(s):
-                    showtimes.append(s)
-
-                elif (s.find("/") != -1 and s.find("Y.") == -1) or s in ["G", "F", "O", "I", "E"]:
-                    languages.append(s)
-
-            if showtimes:
-                showtimes_list.append(showtimes)
-            if languages:
-                languages_list.append(languages)
-
-        if showtimes_list:
-            all_showtimes_lists.append(showtimes_list)
-        if languages_list:
-            all_languages_lists.append(languages_list)
-
-    # Initializing the dictionary to store the lists
-    all_info_dict = dict()
-
-    all_info_dict["movie"] = movies_list
-    all_info_dict["genre"] = genres_list
-    all_info_dict["age_limit"] = age_limits
-    all_info_dict["language"] = all_languages_lists
-    all_info_dict["showtime"] = all_showtimes_lists
-    all_info_dict["date"] = f'{date.today()}'
-    all_info_dict["cinema"] = cinemas_list
-    all_info_dict["place"] = places_list
-
-    movie_program_df = pd.DataFrame(all_info_dict).explode(["cinema", "showtime", "place", "language"]).explode(
-        ["showtime", "language"]).reset_index(drop=True)
-    movie_program_df["dt_showtime"] = movie_program_df["date"] + " " + movie_program_df["showtime"]
-    movie_program_df["dt_showtime"] = pd.to_datetime(movie_program_df["dt_showtime"], format='%Y-%m-%d %H:%M')
-    movie_program_df["cinema_place"] = [f'{c} {p}' for c, p in
-                                        zip(movie_program_df["cinema"], movie_program_df["place"])]
-
-    return movie_program_df
+    return content
 
 
 def add_theatre_coordinates(showtimes_df):
@@ -206,6 +104,8 @@ def add_theatre_coordinates(showtimes_df):
         "Xenix Zürich": {"latitude": 47.3752853, "longitude": 8.5261529}
     }
 
-    showtimes_df[["latitude", "longitude"]] = pd.json_normalize(showtimes_df["cinema_place"].map(theatre_loc))
+    # Theatres without known coordinates get missing values
+    showtimes_df["latitude"] = showtimes_df["cinema_place"].map({k: v["latitude"] for k, v in theatre_loc.items()})
+    showtimes_df["longitude"] = showtimes_df["cinema_place"].map({k: v["longitude"] for k, v in theatre_loc.items()})
 
     return showtimes_df
@@ -1,168 +1,258 @@
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
+from lxml import etree
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import time
 from datetime import date
 import re
+import unicodedata
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from .selenium_waits import STEP_TIMEOUTS, SHOWTIMES_LOCATOR, wait_for, page_is_idle, click_when_unobstructed, \
+    showtimes_populated, is_stale
+from .cineman_parsing import MOVIE_XPATH, SHOWTIMES_LIST_XPATH, TEXT_XPATH, format_cineman_content
 
-def is_time_format(str_input):
-    try:
-        time.strptime(str_input, '%H:%M')
-        return True
-    except ValueError:
-        return False
+# Showtimes page of a single city. This url isn't documented by cineman.ch, so every page fetched from it is checked
+# with is_city_page and the Selenium scraper is used whenever it doesn't list the requested city
+CINEMAN_SHOWTIMES_URL = "https://www.cineman.ch/en/showtimes/time/{city}/"
+# Columns with few distinct values that are stored as categoricals in the showtimes dataset
+SHOWTIMES_CATEGORICAL_COLUMNS = ["movie", "genre", "age_limit", "language", "showtime", "cinema", "place",
+                                 "cinema_place"]
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0 Safari/537.36",
+    "Accept-Language": "en"
+}
 
 
-def scrape_cineman(cities=("Zürich")):
+def scrape_cineman(cities=("Zürich",), timeouts=None):
     """
     This function opens a Selenium driver, goes to the cineman.ch Showtimes page.
-    Then it scrapes the entries for a specified city.
+    Then it scrapes the entries for a specified city. Instead of sleeping for fixed amounts of time, every step waits
+    for the page to be ready and logs how long that took.
 
     Optional argument:
-    - cities: tuple of strings, specifies the cities for which showtimes will be scraped, defaults to ('Zürich')
+    - cities: tuple of strings, specifies the cities for which showtimes will be scraped, defaults to ('Zürich',)
+    - timeouts: dictionary, maximum number of seconds per step, overrides the defaults in STEP_TIMEOUTS
 
     Returns:
-    - content: html code of the page scraped with BeautifulSoup
+    - content: lxml tree of the scraped page
     """
+    if isinstance(cities, str):
+        cities = (cities,)
+    timeouts = {**STEP_TIMEOUTS, **(timeouts or {})}
+
     # Open the driver and go to the page with the showtimes
     options = Options()
     options.add_argument("--headless")
     driver = webdriver.Chrome(options=options)
     driver.get("https://www.cineman.ch/en/showtimes/time/")
 
-    # Click the cookie button
-    cookie_button = driver.find_element_by_class_name("cc-btn")
-    cookie_button.click()
-    time.sleep(2)
+    try:
+        wait_for(driver, page_is_idle, "page load", timeouts["page load"])
 
-    # Click the region dropdown, select the city and save
-    region_dropdown = driver.find_element_by_class_name("selectize-control")
-    region_dropdown.click()
+        # Click the cookie button as soon as nothing covers it anymore
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "cc-btn")), "cookie button",
+                 timeouts["cookie button"])
 
-    input_div = driver.find_elements_by_xpath('//input[@type="text"]')
-    for city in cities:
-        input_div[6].send_keys(city)
-        input_div[6].send_keys(Keys.RETURN)
+        # Click the region dropdown, select the city and save
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "selectize-control")), "region dropdown",
+                 timeouts["region dropdown"])
+
+        input_div = driver.find_elements_by_xpath('//input[@type="text"]')
+        for city in cities:
+            input_div[6].send_keys(city)
+            input_div[6].send_keys(Keys.RETURN)
 
-    save_button = driver.find_element_by_class_name("select-region-save")
-    save_button.click()
-    time.sleep(5)
+        old_showtimes = driver.find_elements(*SHOWTIMES_LOCATOR)
+        wait_for(driver, click_when_unobstructed((By.CLASS_NAME, "select-region-save")), "save button",
+                 timeouts["save button"])
 
-    # Scrape the content and close the driver
-    content = BeautifulSoup(driver.page_source, features="html.parser")
-    driver.close()
+        # Wait for the showtimes of the selected region to replace the old ones
+        if old_showtimes:
+            wait_for(driver, is_stale(old_showtimes[0]), "showtimes refresh", timeouts["showtimes refresh"],
+                     required=False)
+        wait_for(driver, page_is_idle, "network idle", timeouts["network idle"])
+        wait_for(driver, showtimes_populated, "showtimes", timeouts["showtimes"])
+
+        # Scrape the content
+        content = etree.HTML(driver.page_source)
+    finally:
+        driver.quit()
 
     return content
 
 
-def format_cineman_content(html_content):
+def create_http_session(pool_size=4, retries=3):
     """
-    This function takes in content scraped from cineman.ch with BeautifulSoup and creates a dataframe from it.
+    This function creates a requests session with a pool of keep-alive connections and retries on server errors.
 
-    Required arguments:
-    - content: html contents scraped from cineman.ch
+    Optional arguments:
+    - pool_size: int, maximum number of pooled connections per host, defaults to 4
+    - retries: int, number of retries on connection errors, 429 and 5xx responses, defaults to 3
 
     Returns:
-    - movie_program_df: pandas dataframe containing the scraped data
-    """
-    movies = html_content.findAll("div", {"class": "col-xs-12 col-sm-9"})
-
-    # Now create the data frame
-    # Initialize the lists to store the details for each movie screening
-    movies_list = []
-    genres_list = []
-    cinemas_list = []
-    places_list = []
-    age_limits = []
-    all_showtimes_lists = []
-    all_languages_lists = []
-
-    for movie in movies:
-        # Movie title
-        title = movie.find("h4").get_text()
-        movies_list.append(title)
-
-        # Movie genre
-        genre = movie.find("p").get_text()
-        genres_list.append(genre)
-
-        # Cinemas and place
-        cinemas = movie.findAll("h5")
-        cinema_names = []
-        places = []
-
-        for cinema in cinemas:
-            cinema_name = cinema.find("em").get_text()
-            cinema_names.append(cinema_name)
-            place = cinema.findAll("a")[1].get_text()
-            places.append(place)
-
-        cinemas_list.append(cinema_names)
-        places_list.append(places)
-
-        # Age limit
-        age_links = movie.findAll("a", {"class": "link"})
-        age_limit = age_links[-1].get_text()
-        if age_limit == "Reservation":
-            age_limit = age_links[-2].get_text()
-        if age_limit.find("Y.") == -1:
-            age_limits.append("unknown")
-        else:
-            age_limits.append(age_limit)
-
-        # Showtimes and languages
-        showtimes_list_div = movie.find("div", {"class": "showtimes-list"})
-        showtimes_string = showtimes_list_div.prettify().split("h5")
-        showtimes_list = []
-        languages_list = []
-
-        for string in showtimes_string:
-            strings = re.sub('<[^<]+?>\n', '', string).split(" ")
-            showtimes = []
-            languages = []
-
-            for s in strings:
-                s = s.strip("<></–)")
-                s = re.sub("\t", "", s)
-                s = s.strip()
-
-                if is_time_format(s):
-                    showtimes.append(s)
-
-                elif (s.find("/") != -1 and s.find("Y.") == -1) or s in ["G", "F", "O", "I", "E"]:
-                    languages.append(s)
-
-            if showtimes:
-                showtimes_list.append(showtimes)
-            if languages:
-                languages_list.append(languages)
-
-        if showtimes_list:
-            all_showtimes_lists.append(showtimes_list)
-        if languages_list:
-            all_languages_lists.append(languages_list)
-
-    # Initializing the dictionary to store the lists
-    all_info_dict = dict()
-
-    all_info_dict["movie"] = movies_list
-    all_info_dict["genre"] = genres_list
-    all_info_dict["age_limit"] = age_limits
-    all_info_dict["language"] = all_languages_lists
-    all_info_dict["showtime"] = all_showtimes_lists
-    all_info_dict["date"] = f'{date.today()}'
-    all_info_dict["cinema"] = cinemas_list
-    all_info_dict["place"] = places_list
-
-    movie_program_df = pd.DataFrame(all_info_dict).explode(["cinema", "showtime", "place", "language"]).explode(
-        ["showtime", "language"]).reset_index(drop=True)
-    movie_program_df["dt_showtime"] = movie_program_df["date"] + " " + movie_program_df["showtime"]
-    movie_program_df["dt_showtime"] = pd.to_datetime(movie_program_df["dt_showtime"], format='%Y-%m-%d %H:%M')
-    movie_program_df["cinema_place"] = [f'{c} {p}' for c, p in
-                                        zip(movie_program_df["cinema"], movie_program_df["place"])]
+    - session: requests.Session
+    """
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HTTP_HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def city_slug(city):
+    slug = city.lower().replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("è", "e").replace("é", "e")
+    return re.sub(r"[^a-z0-9]+", "-", slug).strip("-")
+
+
+def has_showtimes(content):
+    return len(SHOWTIMES_LIST_XPATH(content)) > 0
+
+
+def normalize_place(place):
+    return unicodedata.normalize("NFC", str(place)).strip().casefold()
+
+
+def page_places(content):
+    """
+    Returns the set of (normalized) places of all cinemas listed on a showtimes page.
+    """
+    places = set()
+    for movie in MOVIE_XPATH(content):
+        for cinema in movie.iterdescendants("h5"):
+            links = list(cinema.iterdescendants("a"))
+            if len(links) > 1:
+                places.add(normalize_place(TEXT_XPATH(links[1])))
+
+    return places
+
+
+def is_city_page(content, cities):
+    """
+    Checks that a showtimes page lists cinemas in exactly the requested cities. The default page of cineman.ch
+    already shows the programme of another region, so a redirect or an ignored city in the url would otherwise go
+    unnoticed.
+    """
+    return has_showtimes(content) and page_places(content) == {normalize_place(city) for city in cities}
+
+
+def scrape_cineman_http(cities=("Zürich",), session=None, url=CINEMAN_SHOWTIMES_URL, timeout=30):
+    """
+    This function downloads the cineman.ch showtimes page of each city with plain HTTP requests, without starting a
+    browser.
+
+    Optional arguments:
+    - cities: tuple of strings, the cities for which showtimes will be scraped, defaults to ('Zürich',)
+    - session: requests.Session to reuse, defaults to a new session from create_http_session
+    - url: string, url template of the showtimes page with a {city} placeholder, defaults to CINEMAN_SHOWTIMES_URL
+    - timeout: number, seconds to wait for each response, defaults to 30
+
+    Returns:
+    - content: lxml tree of the downloaded pages
+    """
+    if isinstance(cities, str):
+        cities = (cities,)
+    if session is None:
+        session = create_http_session()
+
+    pages = []
+    for city in cities:
+        response = session.get(url.format(city=city_slug(city)), timeout=timeout)
+        response.raise_for_status()
+        pages.append(response.text)
+
+    content = etree.HTML("".join(pages))
+
+    return content
+
+
+def fetch_cineman_content(cities=("Zürich",), session=None, selenium_fallback=True):
+    """
+    This function scrapes the showtimes with plain HTTP requests and only falls back to the Selenium scraper if the
+    request fails or the page doesn't list showtimes in exactly the requested cities (e.g. because they are loaded
+    by javascript, or the server ignored the city in the url).
+
+    Optional arguments:
+    - cities: tuple of strings, the cities for which showtimes will be scraped, defaults to ('Zürich',)
+    - session: requests.Session to reuse, defaults to a new session from create_http_session
+    - selenium_fallback: boolean, whether to fall back to the Selenium scraper, defaults to True
+
+    Returns:
+    - content: lxml tree of the scraped page
+    """
+    logger = logging.getLogger(__name__)
+    if isinstance(cities, str):
+        cities = (cities,)
+
+    try:
+        content = scrape_cineman_http(cities=cities, session=session)
+        if is_city_page(content, cities):
+            return content
+        logger.warning(f"The plain HTTP response doesn't contain the showtimes of {', '.join(cities)} "
+                       f"(places found: {', '.join(sorted(page_places(content))) or 'none'})")
+    except requests.RequestException as e:
+        logger.warning(f"Plain HTTP scraping failed: {e}")
+
+    if not selenium_fallback:
+        raise ValueError("No showtimes could be scraped without a browser")
+
+    logger.info("Falling back to the Selenium scraper")
+    return scrape_cineman(cities=cities)
+
+
+def scrape_cities(cities=("Zürich",), max_workers=2, min_interval=1., session=None):
+    """
+    This function scrapes the showtimes of several cities concurrently and merges them into one data frame.
+    At most max_workers cities are scraped at the same time (over a shared HTTP session, or with one browser each
+    if the Selenium fallback is needed) and consecutive requests to cineman.ch start at least min_interval seconds
+    apart.
+
+    Optional arguments:
+    - cities: tuple of strings, the cities for which showtimes will be scraped, defaults to ('Zürich',)
+    - max_workers: int, maximum number of cities scraped at the same time, defaults to 2
+    - min_interval: number, minimum number of seconds between the start of two requests, defaults to 1
+    - session: requests.Session to reuse, defaults to a new session from create_http_session
+
+    Returns:
+    - movie_program_df: pandas dataframe containing the scraped data, with an additional city column
+    """
+    if isinstance(cities, str):
+        cities = (cities,)
+    if session is None:
+        session = create_http_session(pool_size=max_workers)
+
+    lock = threading.Lock()
+    last_request = [0.]
+
+    def scrape_city(city):
+        # Space out the requests to be polite to cineman.ch
+        with lock:
+            wait = last_request[0] + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_request[0] = time.monotonic()
+
+        content = fetch_cineman_content(cities=(city,), session=session)
+        city_df = format_cineman_content(html_content=content)
+        city_df["city"] = city
+
+        return city_df
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        city_dfs = list(executor.map(scrape_city, cities))
+
+    movie_program_df = pd.concat(city_dfs, ignore_index=True)
 
     return movie_program_df
 
@@ -199,6 +289,56 @@ def add_theatre_coordinates(showtimes_df):
         "Xenix Zürich": {"latitude": 47.3752853, "longitude": 8.5261529}
     }
 
-    showtimes_df[["latitude", "longitude"]] = pd.json_normalize(showtimes_df["cinema_place"].map(theatre_loc))
+    # Theatres without known coordinates get missing values
+    showtimes_df["latitude"] = showtimes_df["cinema_place"].map({k: v["latitude"] for k, v in theatre_loc.items()})
+    showtimes_df["longitude"] = showtimes_df["cinema_place"].map({k: v["longitude"] for k, v in theatre_loc.items()})
 
     return showtimes_df
+
+
+def to_typed_showtimes(showtimes_df):
+    """
+    This function converts the scraped showtimes into compact column types: categoricals for the text columns,
+    datetime64 for the showtimes and float32 for the coordinates.
+
+    Required arguments:
+    - showtimes_df: pandas DataFrame, as returned by add_theatre_coordinates
+
+    Returns:
+    - typed_df: pandas DataFrame with the same columns and rows, but typed
+    """
+    typed_df = showtimes_df.copy()
+    for column in SHOWTIMES_CATEGORICAL_COLUMNS:
+        if column in typed_df.columns:
+            typed_df[column] = typed_df[column].astype("category")
+    typed_df["dt_showtime"] = pd.to_datetime(typed_df["dt_showtime"])
+    for column in ["latitude", "longitude"]:
+        if column in typed_df.columns:
+            typed_df[column] = typed_df[column].astype("float32")
+
+    return typed_df
+
+
+def save_showtimes(showtimes_df, dataset_path, day=None):
+    """
+    This function saves the showtimes of one day as a partition of a Parquet dataset, in the folder
+    {dataset_path}/date={day}/. Saving the same day again replaces its partition.
+
+    Required arguments:
+    - showtimes_df: pandas DataFrame, as returned by add_theatre_coordinates
+    - dataset_path: string, the root folder of the dataset
+
+    Optional arguments:
+    - day: string, the date of the showtimes (YYYY-MM-DD), defaults to today
+
+    Returns:
+    - partition_path: string, the path of the written Parquet file
+    """
+    day = day or f'{date.today()}'
+    partition_path = f"{dataset_path}/date={day}/showtimes.parquet"
+
+    # The date is encoded in the folder name, so it isn't stored in the file itself
+    typed_df = to_typed_showtimes(showtimes_df.drop(columns=["date"], errors="ignore"))
+    typed_df.to_parquet(partition_path, index=False)
+
+    return partition_path
@@ -0,0 +1,100 @@
+from selenium.common.exceptions import ElementClickInterceptedException, ElementNotInteractableException, \
+    StaleElementReferenceException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+import time
+import logging
+
+
+SHOWTIMES_LOCATOR = (By.CLASS_NAME, "showtimes-list")
+
+# Maximum number of seconds each step of the scrapers may wait
+STEP_TIMEOUTS = {
+    "page load": 30,
+    "cookie button": 30,
+    "sort button": 10,
+    "region dropdown": 10,
+    "save button": 10,
+    "showtimes refresh": 10,
+    "network idle": 20,
+    "showtimes": 20
+}
+
+
+def wait_for(driver, condition, step, timeout, required=True, poll_frequency=0.2):
+    """
+    This function waits until a condition is met and logs how long it took.
+
+    Required arguments:
+    - driver: Selenium webdriver
+    - condition: callable that takes the driver and returns a truthy value once the page is ready
+    - step: string, name of the step used in the logs
+    - timeout: number, maximum number of seconds to wait
+
+    Optional arguments:
+    - required: boolean, if False a timeout is only logged instead of raised, defaults to True
+    - poll_frequency: number, seconds between two checks of the condition, defaults to 0.2
+
+    Returns:
+    - result: the return value of the condition, or None if an optional step timed out
+    """
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(
+            condition, message=f"Timed out after {timeout}s waiting for {step}")
+    except TimeoutException:
+        logger.warning(f"Step '{step}' timed out after {time.perf_counter() - start:.2f}s")
+        if required:
+            raise
+        return None
+    logger.info(f"Step '{step}' waited {time.perf_counter() - start:.2f}s")
+
+    return result
+
+
+def page_is_idle(driver):
+    """
+    Condition that is met once the document is loaded and no jQuery requests are running anymore.
+    """
+    return driver.execute_script(
+        "return document.readyState === 'complete' && (typeof jQuery === 'undefined' || jQuery.active === 0);")
+
+
+def click_when_unobstructed(locator, index=0):
+    """
+    Returns a condition that clicks the index-th element matching the locator as soon as it is clickable and not
+    covered by anything else (e.g. an advertisement overlay).
+    """
+    def condition(driver):
+        elements = driver.find_elements(*locator)
+        if len(elements) <= index:
+            return False
+        try:
+            elements[index].click()
+        except (ElementClickInterceptedException, ElementNotInteractableException, StaleElementReferenceException):
+            return False
+        return True
+
+    return condition
+
+
+def showtimes_populated(driver):
+    """
+    Condition that is met once the page contains at least one list of showtimes.
+    """
+    return len(driver.find_elements(*SHOWTIMES_LOCATOR)) > 0
+
+
+def is_stale(element):
+    """
+    Returns a condition that is met once the element has been removed from the page.
+    """
+    def condition(driver):
+        try:
+            element.is_enabled()
+        except StaleElementReferenceException:
+            return True
+        return False
+
+    return condition
@@ -0,0 +1,253 @@
+import re
+import json
+import logging
+import unicodedata
+import numpy as np
+import s3fs
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+# Leading articles (English, German, French, Italian and Spanish). Articles are part of the canonical title, so "Hard"
+# doesn't match "Die Hard" and "A Hero" doesn't match "The Hero", and fuzzy matches need an article on both sides
+TITLE_ARTICLES = frozenset(["the", "a", "an", "der", "die", "das", "ein", "eine", "le", "la", "les", "l", "un", "une",
+                            "il", "lo", "gli", "el", "los", "las"])
+YEAR_PATTERN = re.compile(r"\s*[\(\[](?:18|19|20)\d{2}[\)\]]\s*$")
+NON_ALPHANUMERIC_PATTERN = re.compile(r"[^\w]+")
+# Sequels are told apart by their numbers, roman numerals count as the same number
+ROMAN_NUMERALS = {"ii": "2", "iii": "3", "iv": "4", "v": "5", "vi": "6", "vii": "7", "viii": "8", "ix": "9", "x": "10"}
+
+# Titles are compared by the cosine similarity of their hashed character 3-grams
+NGRAM_VECTORIZER = HashingVectorizer(analyzer="char_wb", ngram_range=(3, 3), n_features=2 ** 20, norm="l2",
+                                     alternate_sign=False, dtype=np.float32)
+MIN_MATCH_SCORE = 0.8
+# Saved canonical and fuzzy matches made by an older version of the matching rules are matched again
+MATCHER_VERSION = 3
+
+
+def canonical_title(title):
+    """
+    This function reduces a title to a canonical form for matching: lower case, without accents, punctuation or a
+    trailing year. For example "Le Fabuleux Destin d'Amélie Poulain (2001)" becomes
+    "le fabuleux destin d amelie poulain".
+    """
+    title = unicodedata.normalize("NFKD", str(title))
+    title = "".join(char for char in title if not unicodedata.combining(char)).casefold().strip()
+    title = YEAR_PATTERN.sub("", title)
+
+    return " ".join(NON_ALPHANUMERIC_PATTERN.sub(" ", title).split())
+
+
+def has_article(canonical):
+    """
+    Returns True if the canonical title starts with an article (and has more words).
+    """
+    words = canonical.split()
+
+    return len(words) > 1 and words[0] in TITLE_ARTICLES
+
+
+def title_numbers(canonical):
+    """
+    Returns the numbers in a canonical title as a sorted tuple, with roman numerals written as digits, so
+    "rocky ii" and "rocky 2" have the same numbers and "spider man 3" differs from "spider man 2".
+    """
+    return tuple(sorted(ROMAN_NUMERALS.get(word, word) for word in canonical.split()
+                        if word.isdigit() or word in ROMAN_NUMERALS))
+
+
+def fuzzy_group(canonical):
+    """
+    Returns the group of a canonical title for fuzzy matching: titles are only compared with titles that have the
+    same numbers and that also start with an article, or also don't.
+    """
+    return title_numbers(canonical), has_article(canonical)
+
+
+def popularity_rank(entry):
+    return entry[1]
+
+
+class TitleMatcher:
+    """
+    Matches titles against the movies of the TMDB export while it is streamed, so neither the export nor an index of
+    all its titles is held in memory. Every movie passed to add is kept if its canonical title is the canonical
+    title of one of the titles, and otherwise collected as fuzzy candidate. The candidates are scored by the cosine
+    similarity of their character n-grams in chunks of chunk_size, within the same fuzzy_group only, so a sequel is
+    never matched with another part of its series. Of several equally good movies, the one with the highest rank is
+    taken.
+    """
+    def __init__(self, titles, normalize, rank=popularity_rank, min_score=MIN_MATCH_SCORE, chunk_size=50000):
+        self.titles = list(titles)
+        self.normalize = normalize
+        self.rank = rank
+        self.min_score = min_score
+        self.chunk_size = chunk_size
+        self.canonical_titles = {title: canonical_title(title) for title in self.titles}
+
+        title_groups = dict()
+        for title, canonical in self.canonical_titles.items():
+            title_groups.setdefault(fuzzy_group(canonical), []).append(title)
+        self.query_groups = {group: (group_titles, NGRAM_VECTORIZER.transform(
+            [self.canonical_titles[title] for title in group_titles])) for group, group_titles in title_groups.items()}
+
+        # Best movie per canonical title of the titles, and best fuzzy candidate per title as (score, rank, key, entry)
+        self.canonical_matches = {canonical: None for canonical in self.canonical_titles.values()}
+        self.fuzzy_matches = dict()
+        self.chunk = dict()
+        self.chunk_length = 0
+
+    def add(self, key, entry):
+        """
+        Adds a movie of the export, given by its normalized title and its (id, popularity, adult, video) tuple.
+        """
+        if entry[0] is None:
+            return
+        canonical = canonical_title(key)
+        if canonical in self.canonical_matches:
+            current = self.canonical_matches[canonical]
+            if current is None or self.rank(entry) > self.rank(current[1]):
+                self.canonical_matches[canonical] = (key, entry)
+        group = fuzzy_group(canonical)
+        if group in self.query_groups:
+            self.chunk.setdefault(group, []).append((canonical, key, entry))
+            self.chunk_length += 1
+            if self.chunk_length >= self.chunk_size:
+                self.score_chunk()
+
+    def score_chunk(self):
+        """
+        Scores the collected candidates against the titles of their group with one sparse matrix product per group
+        and keeps the best candidate of each title.
+        """
+        for group, candidates in self.chunk.items():
+            group_titles, query_matrix = self.query_groups[group]
+            candidate_matrix = NGRAM_VECTORIZER.transform([canonical for canonical, _, _ in candidates])
+            scores = (query_matrix @ candidate_matrix.T).toarray()
+            for title, title_scores in zip(group_titles, scores):
+                best_score = title_scores.max()
+                if best_score <= 0:
+                    continue
+                _, key, entry = max((candidates[idx] for idx in np.flatnonzero(title_scores == best_score)),
+                                    key=lambda candidate: self.rank(candidate[2]))
+                current = self.fuzzy_matches.get(title)
+                if current is None or (best_score, self.rank(entry)) > current[:2]:
+                    self.fuzzy_matches[title] = (best_score, self.rank(entry), key, entry)
+        self.chunk = dict()
+        self.chunk_length = 0
+
+    def matches(self, title_index):
+        """
+        This function matches every title in three steps: an exact lookup of the normalized title in the title
+        index, the most popular movie with the same canonical title and the most similar canonical title by
+        character n-grams. Titles with different articles ("Der Batman", "The Batman") only match through their
+        n-gram score. The entries of the canonical and fuzzy matches are added to title_index.
+
+        Required arguments:
+        - title_index: dictionary mapping normalized titles to (id, popularity, adult, video) tuples, with at least
+        the normalized titles of all titles that were in the export
+
+        Returns:
+        - matches: dictionary mapping each title to a dictionary with the matched "key" of the title index (None if
+        there is no match), the "method" that found it and its "score"
+        """
+        self.score_chunk()
+        matches = dict()
+        for title in self.titles:
+            key = self.normalize(title)
+            canonical_match = self.canonical_matches[self.canonical_titles[title]]
+            fuzzy_match = self.fuzzy_matches.get(title)
+            if key in title_index and title_index[key][0] is not None:
+                matches[title] = {"key": key, "method": "exact", "score": 1.}
+            elif canonical_match is not None:
+                title_index[canonical_match[0]] = canonical_match[1]
+                matches[title] = {"key": canonical_match[0], "method": "canonical", "score": 1.}
+            elif fuzzy_match is not None and fuzzy_match[0] >= self.min_score:
+                title_index[fuzzy_match[2]] = fuzzy_match[3]
+                matches[title] = {"key": fuzzy_match[2], "method": "fuzzy", "score": float(fuzzy_match[0])}
+            else:
+                score = float(fuzzy_match[0]) if fuzzy_match is not None else 0.
+                matches[title] = {"key": None, "method": None, "score": score}
+
+        return matches
+
+
+def pending_titles(titles, match_table, export_version):
+    """
+    Returns the titles that have to be matched against the export: titles that are new, that had no match in an
+    older TMDB export, or whose canonical or fuzzy match was made with older matching rules (MATCHER_VERSION).
+    """
+    pending = []
+    for title in titles:
+        match = match_table.get(title)
+        if match is None:
+            pending.append(title)
+        elif match["key"] is None and match["export_version"] != export_version:
+            pending.append(title)
+        elif match["method"] != "exact" and match.get("matcher_version") != MATCHER_VERSION:
+            pending.append(title)
+
+    return pending
+
+
+def load_match_table(TMDB_MATCH_TABLE_PATH):
+    """
+    Returns the saved match table (title -> match), or an empty table if there is none yet.
+    """
+    fs = s3fs.S3FileSystem(anon=False)
+    if not fs.exists(TMDB_MATCH_TABLE_PATH):
+        return dict()
+    with fs.open(TMDB_MATCH_TABLE_PATH) as f:
+        return json.load(f)
+
+
+def save_match_table(match_table, TMDB_MATCH_TABLE_PATH):
+    """
+    Saves the match table as json.
+    """
+    fs = s3fs.S3FileSystem(anon=False)
+    with fs.open(TMDB_MATCH_TABLE_PATH, "w") as f:
+        json.dump(match_table, f)
+
+
+def resolve_titles(titles, title_index, export_version, normalize, match_table, matches):
+    """
+    This function stores the new matches of the pending titles in the match table and looks up all other titles
+    there. All saved matches are kept, so the export, which changes every day, doesn't trigger any matching by
+    itself. A saved match that is no longer in the title index is replaced by the exact match of the title, or
+    marked as unmatched, so the title is matched again against the next export. The match table is updated in place.
+
+    Required arguments:
+    - titles: list of strings, the titles to resolve
+    - title_index: dictionary mapping normalized titles to (id, popularity, adult, video) tuples
+    - export_version: string, the version of the TMDB export the title index was built from
+    - normalize: function that turns a title into a key of the title index
+    - match_table: dictionary mapping titles to their saved matches
+    - matches: dictionary with the new matches of the pending titles, as returned by TitleMatcher.matches
+
+    Returns:
+    - resolved: dictionary mapping each title to its key in the title index, or None if it couldn't be matched
+    """
+    logger = logging.getLogger(__name__)
+
+    for title in titles:
+        match = matches.get(title)
+        saved_match = match_table.get(title)
+        if match is None and saved_match is not None and saved_match["key"] is not None and \
+                (saved_match["key"] not in title_index or title_index[saved_match["key"]][0] is None):
+            key = normalize(title)
+            if key in title_index and title_index[key][0] is not None:
+                match = {"key": key, "method": "exact", "score": 1.}
+            else:
+                match = {"key": None, "method": None, "score": 0.}
+        if match is None:
+            continue
+
+        match["export_version"] = export_version
+        match["matcher_version"] = MATCHER_VERSION
+        match_table[title] = match
+        if match["method"] == "fuzzy":
+            logger.info(f"'{title}' matched with '{match['key']}' (score {match['score']:.2f})")
+        elif match["key"] is None:
+            logger.info(f"'{title}' has no match in the TMDB export")
+
+    return {title: match_table[title]["key"] for title in titles}
@@ -1,61 +1,491 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import gzip
+import time
+import random
+import os
+import zlib
+import pickle
+import logging
+import tempfile
+import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from urllib.error import HTTPError
 from datetime import date, timedelta
 import s3fs
 
+from .title_matching import TitleMatcher, load_match_table, save_match_table, pending_titles, resolve_titles
 
-def fetch_tmdb_movie_ids(TMDB_IDS_FILE_PATH):
+
+TMDB_API_URL = "https://api.themoviedb.org/3"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+TMDB_CACHE_TTL = 7 * 24 * 60 * 60
+TMDB_CACHE_MAX_ENTRIES = 5000
+TMDB_EXPORT_COLUMNS = ["adult", "id", "original_title", "popularity", "video"]
+TMDB_EXPORT_URL = "http://files.tmdb.org/p/exports/{export_name}"
+LOCAL_CACHE_DIR = os.path.join(tempfile.gettempdir(), "zmr_cache", "tmdb")
+# Title index entry of a wanted title that isn't in the export
+MISSING_ENTRY = (None, 0, None, None)
+
+
+class TokenBucket:
     """
-    This function downloads the zipped json file from TMDB with the most recent movie IDs in it.
-    Then it unzippes the file and stores its contents in a data frame.
+    Thread-safe token bucket: allows bursts of up to capacity requests and rate requests per second on average.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_tmdb_session(pool_size=8):
+    """
+    This function creates a requests session that keeps up to pool_size connections to TMDB alive.
+    """
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def request_movie_details(movie_id, api_key, session, rate_limiter=None, api_url=TMDB_API_URL, headers=None,
+                          max_retries=5, backoff=0.5, timeout=10):
+    """
+    This function requests the details of one movie from the TMDB api. Responses with status 429 or 5xx and
+    connection errors are retried with exponential backoff (or after the time given in the Retry-After header).
+
+    Required arguments:
+    - movie_id: int, the TMDB id of the movie
+    - api_key: string, the TMDB api key
+    - session: requests.Session used for the request
 
     Optional arguments:
-    - directory: string, path to the folder where the zipped file from tmdb will be saved, defaults to
-        TMDB_IDS_FILE_PATH (user dependent)
+    - rate_limiter: TokenBucket that every request (including retries) has to take a token from, defaults to None
+    - api_url: string, the base url of the api, defaults to TMDB_API_URL
+    - headers: dictionary of additional request headers (e.g. for conditional requests), defaults to None
+    - max_retries: int, maximum number of retries, defaults to 5
+    - backoff: number, seconds to wait before the first retry, doubled for every further retry, defaults to 0.5
+    - timeout: number, seconds to wait for a response, defaults to 10
 
     Returns:
-    - movie_id_df: pandas dataframe containing the ID and other information on all the tmdb movies.
+    - response: requests.Response with status 200 or 304
+    """
+    url = f"{api_url}/movie/{movie_id}"
+
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = session.get(url, params={"api_key": api_key}, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+            response.raise_for_status()
+            return response
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            time.sleep(int(retry_after))
+        else:
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+
+def fetch_movie_details(movie_id, api_key, session, rate_limiter=None, api_url=TMDB_API_URL, cache=None,
+                        ttl=TMDB_CACHE_TTL):
+    """
+    This function returns the details of one movie. If a cache is given, fresh cache entries are returned without
+    any request, and expired entries are revalidated with their ETag / Last-Modified headers before they are
+    downloaded again.
+
+    Required arguments:
+    - movie_id: int, the TMDB id of the movie
+    - api_key: string, the TMDB api key
+    - session: requests.Session used for the request
+
+    Optional arguments:
+    - rate_limiter: TokenBucket that every request has to take a token from, defaults to None
+    - api_url: string, the base url of the api, defaults to TMDB_API_URL
+    - cache: dictionary of cache entries keyed by movie id (as string), updated in place, defaults to None
+    - ttl: number, seconds a cache entry stays fresh, defaults to TMDB_CACHE_TTL
+
+    Returns:
+    - movie_json: dictionary with the movie details
+    """
+    if cache is None:
+        response = request_movie_details(movie_id=movie_id, api_key=api_key, session=session,
+                                         rate_limiter=rate_limiter, api_url=api_url)
+        return response.json()
+
+    key = str(movie_id)
+    now = time.time()
+    entry = cache.get(key)
+    if entry is not None and now - entry["fetched"] < ttl:
+        entry["last_used"] = now
+        return entry["data"]
+
+    # Ask TMDB whether the cached version is still valid
+    headers = dict()
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = request_movie_details(movie_id=movie_id, api_key=api_key, session=session, rate_limiter=rate_limiter,
+                                     api_url=api_url, headers=headers)
+    if response.status_code == 304 and entry is not None:
+        entry["fetched"] = now
+        entry["last_used"] = now
+        return entry["data"]
+
+    movie_json = response.json()
+    cache[key] = {"fetched": now, "last_used": now, "etag": response.headers.get("ETag"),
+                  "last_modified": response.headers.get("Last-Modified"), "data": movie_json}
+
+    return movie_json
+
+
+def fetch_all_movie_details(movie_ids, api_key, max_workers=8, requests_per_second=20, session=None,
+                            api_url=TMDB_API_URL, cache=None, ttl=TMDB_CACHE_TTL):
+    """
+    This function requests the details of several movies concurrently over one keep-alive session. At most
+    max_workers requests are open at the same time and no more than requests_per_second are started on average.
+
+    Required arguments:
+    - movie_ids: list of ints, the TMDB ids of the movies
+    - api_key: string, the TMDB api key
+
+    Optional arguments:
+    - max_workers: int, maximum number of concurrent requests, defaults to 8
+    - requests_per_second: number, the rate limit, defaults to 20
+    - session: requests.Session to reuse, defaults to a new session from create_tmdb_session
+    - api_url: string, the base url of the api (e.g. a local stub server), defaults to TMDB_API_URL
+    - cache: dictionary of cache entries keyed by movie id, see fetch_movie_details, defaults to None
+    - ttl: number, seconds a cache entry stays fresh, defaults to TMDB_CACHE_TTL
+
+    Returns:
+    - movie_jsons: list of dictionaries with the movie details, in the same order as movie_ids
+    """
+    if session is None:
+        session = create_tmdb_session(pool_size=max_workers)
+    rate_limiter = TokenBucket(rate=requests_per_second)
+
+    def fetch(movie_id):
+        return fetch_movie_details(movie_id=movie_id, api_key=api_key, session=session, rate_limiter=rate_limiter,
+                                   api_url=api_url, cache=cache, ttl=ttl)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        movie_jsons = list(executor.map(fetch, movie_ids))
+
+    return movie_jsons
+
+
+def load_tmdb_cache(TMDB_CACHE_PATH):
+    """
+    This function loads the cached TMDB responses. Returns an empty cache if the file doesn't exist yet.
     """
     fs = s3fs.S3FileSystem(anon=False)
-    # Try to get the file for today
-    try:
-        year = str(date.today() - timedelta(days=1))[0:4]
-        month = str(date.today() - timedelta(days=1))[5:7]
-        day = str(date.today() - timedelta(days=1))[8:10]
+    if not fs.exists(TMDB_CACHE_PATH):
+        return dict()
+    with fs.open(TMDB_CACHE_PATH) as f:
+        cache = json.load(f)
+
+    return cache
+
 
-        path = f"http://files.tmdb.org/p/exports/movie_ids_{month}_{day}_{year}.json.gz"
-        with fs.open(TMDB_IDS_FILE_PATH, "wb") as f:
-            r = requests.get(path)
-            f.write(r.content)
+def save_tmdb_cache(cache, TMDB_CACHE_PATH, max_entries=TMDB_CACHE_MAX_ENTRIES):
+    """
+    This function saves the cached TMDB responses. If there are more than max_entries, the least recently used
+    entries are evicted first.
+    """
+    if len(cache) > max_entries:
+        keep = sorted(cache, key=lambda key: cache[key]["last_used"], reverse=True)[:max_entries]
+        cache = {key: cache[key] for key in keep}
+
+    fs = s3fs.S3FileSystem(anon=False)
+    with fs.open(TMDB_CACHE_PATH, "w") as f:
+        json.dump(cache, f)
+
+
+def tmdb_export_name(export_date=None):
+    """
+    Returns the file name of the TMDB movie ID export for a date, defaults to yesterday (the most recent export).
+    """
+    if export_date is None:
+        export_date = date.today() - timedelta(days=1)
+    return f"movie_ids_{export_date:%m_%d_%Y}.json.gz"
+
+
+def read_export_version(fs, TMDB_IDS_FILE_PATH):
+    """
+    Returns the name of the export saved at TMDB_IDS_FILE_PATH (from its json marker), or its ETag for files that
+    were saved without a marker.
+    """
+    marker_path = f"{TMDB_IDS_FILE_PATH}.json"
+    if fs.exists(marker_path):
+        with fs.open(marker_path) as f:
+            return json.load(f)["export_name"]
+    export_info = fs.info(TMDB_IDS_FILE_PATH)
+    return str(export_info.get("ETag") or (export_info.get("size"), export_info.get("LastModified")))
+
+
+def stream_tmdb_movie_ids(export_name, fs, remote_tmp_path, local_tmp_path, chunk_size=1024 * 1024):
+    """
+    This function downloads a TMDB movie ID export and yields one dictionary per movie while the download is running.
+    Every chunk is written as it is to a temporary file in the bucket and in the local cache, and decompressed exactly
+    once, for the lines it contains. Raises ValueError once the response has ended if the gzip stream is incomplete.
+    """
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    rest = b""
+    with requests.get(TMDB_EXPORT_URL.format(export_name=export_name), stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with fs.open(remote_tmp_path, "wb") as remote_file, open(local_tmp_path, "wb") as local_file:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                remote_file.write(chunk)
+                local_file.write(chunk)
+                # The last piece of each chunk may be an incomplete line, it is completed by the next chunk
+                lines = (rest + decompressor.decompress(chunk)).split(b"\n")
+                rest = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+    if not decompressor.eof:
+        raise ValueError(f"Download of {export_name} is incomplete")
+    if rest.strip():
+        yield json.loads(rest)
+
+
+def scan_tmdb_movie_ids(TMDB_IDS_FILE_PATH, scan, cache_dir=LOCAL_CACHE_DIR, chunk_size=1024 * 1024):
+    """
+    This function passes the most recent TMDB movie ID export, one dictionary per movie, to scan and returns its
+    result, so every export is read in a single pass. If the export is already in the local cache directory or in
+    the bucket, it is read from there. Otherwise it is downloaded (at most once) and scan reads the movies straight
+    from the download stream, while the zipped export is saved to the bucket and the local cache. Only a complete
+    download replaces the previous good copy at TMDB_IDS_FILE_PATH; if anything goes wrong, scan is run again on the
+    previous copy.
+
+    Required arguments:
+    - TMDB_IDS_FILE_PATH: string, path in the bucket where the zipped export is saved
+    - scan: function that takes an iterable of movie dictionaries and returns the result
+
+    Optional arguments:
+    - cache_dir: string, local folder in which the export is cached, defaults to LOCAL_CACHE_DIR
+    - chunk_size: int, number of bytes per downloaded chunk, defaults to 1 MB
+
+    Returns:
+    - result: the return value of scan
+    - export_version: string, the name of the export (or the ETag of an older copy without marker)
+    """
+    logger = logging.getLogger(__name__)
+    fs = s3fs.S3FileSystem(anon=False)
+    export_name = tmdb_export_name()
+    local_path = os.path.join(cache_dir, export_name)
+    marker_path = f"{TMDB_IDS_FILE_PATH}.json"
+
+    # Today's export was already downloaded
+    if os.path.exists(local_path):
+        return scan(iter_tmdb_movie_ids(TMDB_IDS_FILE_PATH=local_path)), export_name
+    if fs.exists(marker_path) and read_export_version(fs=fs, TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH) == export_name:
+        return scan(iter_tmdb_movie_ids(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH)), export_name
+
+    os.makedirs(cache_dir, exist_ok=True)
+    remote_tmp_path = f"{TMDB_IDS_FILE_PATH}.tmp"
+    local_tmp_path = f"{local_path}.tmp"
+    movies = stream_tmdb_movie_ids(export_name=export_name, fs=fs, remote_tmp_path=remote_tmp_path,
+                                   local_tmp_path=local_tmp_path, chunk_size=chunk_size)
+    try:
+        result = scan(movies)
+        # The download is only checked for completeness once the stream is exhausted
+        for _ in movies:
+            pass
 
     # If it's not available on TMDB, use the one already in the bucket
-    except HTTPError:
-        pass
+    except (requests.RequestException, zlib.error, ValueError, OSError) as e:
+        logger.warning(f"TMDB export {export_name} could not be downloaded, using the previous one: {e}")
+        movies.close()
+        if os.path.exists(local_tmp_path):
+            os.remove(local_tmp_path)
+        if fs.exists(remote_tmp_path):
+            fs.rm(remote_tmp_path)
+        return scan(iter_tmdb_movie_ids(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH)), \
+            read_export_version(fs=fs, TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH)
+
+    # Replace the previous good copy and remove older exports from the local cache
+    fs.mv(remote_tmp_path, TMDB_IDS_FILE_PATH)
+    with fs.open(marker_path, "w") as f:
+        json.dump({"export_name": export_name}, f)
+    os.replace(local_tmp_path, local_path)
+    for file_name in os.listdir(cache_dir):
+        if file_name.startswith("movie_ids_") and file_name != export_name:
+            os.remove(os.path.join(cache_dir, file_name))
+
+    return result, export_name
 
-    # Unzip the file
-    with fs.open(TMDB_IDS_FILE_PATH) as f:
-        g = gzip.GzipFile(fileobj=f)
-        json_bytes = g.read()
 
-    # Format the output into a list of strings
-    json_list_of_str = json_bytes.decode().split("\n")
+def iter_tmdb_movie_ids(TMDB_IDS_FILE_PATH):
+    """
+    This function streams the zipped json file with the TMDB movie IDs (in the bucket or on the local disk) and
+    yields one dictionary per movie.
+    """
+    if TMDB_IDS_FILE_PATH.startswith("s3://"):
+        f = s3fs.S3FileSystem(anon=False).open(TMDB_IDS_FILE_PATH)
+    else:
+        f = open(TMDB_IDS_FILE_PATH, "rb")
+    with f:
+        with gzip.GzipFile(fileobj=f) as g:
+            for line in g:
+                if line.strip():
+                    yield json.loads(line)
 
-    # Turn the list of strings into a list of dictionaries
-    dict_list = []
-    for dict_str in json_list_of_str[:-1]:
-        real_dict = json.loads(dict_str)
-        dict_list.append(real_dict)
+
+def fetch_tmdb_movie_ids(TMDB_IDS_FILE_PATH, titles=None):
+    """
+    This function downloads the zipped json file from TMDB with the most recent movie IDs in it.
+    Then it unzippes the file and stores its contents in a data frame. If titles are given, the file is streamed
+    line by line and only the matching movies are kept, so the full export is never held in memory.
+
+    Optional arguments:
+    - directory: string, path to the folder where the zipped file from tmdb will be saved, defaults to
+        TMDB_IDS_FILE_PATH (user dependent)
+    - titles: collection of strings, only movies with one of these original titles are kept, defaults to None (all)
+
+    Returns:
+    - movie_id_df: pandas dataframe containing the ID and other information on all the tmdb movies.
+    """
+    # Unzip the file and parse it line by line, while it is downloaded
+    if titles is not None:
+        titles = set(titles)
+    dict_list, _ = scan_tmdb_movie_ids(
+        TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH,
+        scan=lambda movies: [real_dict for real_dict in movies
+                             if titles is None or real_dict.get("original_title") in titles])
 
     # Convert it to a dataframe
-    movie_id_df = pd.DataFrame(dict_list)
+    movie_id_df = pd.DataFrame(dict_list, columns=TMDB_EXPORT_COLUMNS if not dict_list else None)
 
     return movie_id_df
 
 
-def get_specific_movie_ids(TMDB_IDS_FILE_PATH, DATA_PATH_SHOWS, movies_list=None):
+def normalize_title(title):
+    return unicodedata.normalize("NFC", str(title)).strip().casefold()
+
+
+def tie_break_key(entry):
+    """
+    Orders title index entries with the same popularity: regular movies before adult movies and videos, then by id.
+    """
+    movie_id, _, adult, video = entry
+    return not adult, not video, movie_id or 0
+
+
+def entry_rank(entry):
+    """
+    Orders title index entries by popularity, and entries with the same popularity by tie_break_key.
+    """
+    return entry[1] or 0, tie_break_key(entry)
+
+
+def build_title_index(movies, keys, matcher=None):
+    """
+    This function maps each of the given normalized titles to the movie of the TMDB export with that original title
+    and the highest popularity. If several movies share the highest popularity, regular movies are preferred over
+    adult movies and videos, and then the most recently added movie (highest id) is taken. Only the given titles are
+    kept, so the index grows with the number of wanted titles, not with the export. Every movie is also passed to the
+    matcher, so titles without an exact match are matched in the same pass.
+
+    Required arguments:
+    - movies: iterable of movie dictionaries, as read from the export by scan_tmdb_movie_ids
+    - keys: set of strings, the normalized titles to look up
+
+    Optional arguments:
+    - matcher: TitleMatcher of the titles to match, defaults to None
+
+    Returns:
+    - title_index: dictionary mapping the normalized titles to (id, popularity, adult, video) tuples, MISSING_ENTRY for
+    titles that aren't in the export
+    """
+    title_index = dict()
+    for movie in movies:
+        key = normalize_title(movie.get("original_title", ""))
+        entry = (movie["id"], movie.get("popularity") or 0, movie.get("adult"), movie.get("video"))
+        if key in keys:
+            current = title_index.get(key)
+            if current is None or entry_rank(entry) > entry_rank(current):
+                title_index[key] = entry
+        if matcher is not None:
+            matcher.add(key, entry)
+    for key in keys:
+        title_index.setdefault(key, MISSING_ENTRY)
+
+    return title_index
+
+
+def load_title_index(TMDB_IDS_FILE_PATH, TMDB_TITLE_INDEX_PATH, keys, pending=()):
+    """
+    This function loads the saved title index if it was built from the most recent TMDB export, contains all the
+    given keys and there are no titles to match. Otherwise the index of the keys is built in the same pass that
+    downloads (or reads) the export, the pending titles are matched in that pass as well, and the index, including
+    the keys of the new matches, is saved for the next run.
+
+    Required arguments:
+    - TMDB_IDS_FILE_PATH: string, path in the bucket where the zipped TMDB export is saved
+    - TMDB_TITLE_INDEX_PATH: string, path to the pickled title index
+    - keys: set of strings, the normalized titles to look up
+
+    Optional arguments:
+    - pending: list of strings, titles to match against the export (see pending_titles), defaults to ()
+
+    Returns:
+    - title_index: dictionary mapping normalized titles to (id, popularity, adult, video) tuples
+    - matches: dictionary with the matches of the pending titles, see TitleMatcher.matches
+    - export_version: string, the version of the export the index was built from
+    """
+    fs = s3fs.S3FileSystem(anon=False)
+
+    if not pending and fs.exists(TMDB_TITLE_INDEX_PATH):
+        with fs.open(TMDB_TITLE_INDEX_PATH, "rb") as f:
+            saved_index = pickle.load(f)
+        if saved_index["export_version"] == tmdb_export_name() and set(keys).issubset(saved_index["title_index"]):
+            return saved_index["title_index"], dict(), saved_index["export_version"]
+
+    # The matcher is created by the scan, so it starts over if the scan is repeated on the previous export
+    def scan(movies):
+        matcher = TitleMatcher(titles=pending, normalize=normalize_title, rank=entry_rank) if pending else None
+        return build_title_index(movies=movies, keys=keys, matcher=matcher), matcher
+
+    (title_index, matcher), export_version = scan_tmdb_movie_ids(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH, scan=scan)
+    matches = matcher.matches(title_index) if matcher is not None else dict()
+    with fs.open(TMDB_TITLE_INDEX_PATH, "wb") as f:
+        pickle.dump({"export_version": export_version, "title_index": title_index}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+    return title_index, matches, export_version
+
+
+def get_specific_movie_ids(TMDB_IDS_FILE_PATH, DATA_PATH_SHOWS, movies_list=None, TMDB_TITLE_INDEX_PATH=None,
+                           TMDB_MATCH_TABLE_PATH=None):
     """
     This function takes in a directory, the path to a csv file or a list of movie titles.
     Then it filters the main json file with movie IDs from tmdb to keep only information for those titles that can be matched with
@@ -63,8 +493,14 @@ def get_specific_movie_ids(TMDB_IDS_FILE_PATH, DATA_PATH_SHOWS, movies_list=None
 
     Optional arguments:
     - directory: string, path to the folder where the zipped file from tmdb will be saved, defaults to TMDB_IDS_FILE_PATH (user dependent)
-    - csv_path: string, the path to a csv file with movie titles (will be read in), defaults to DATA_PATH_SHOWS (user dependent)
+    - csv_path: string, the path to a csv or parquet file with movie titles (will be read in), defaults to DATA_PATH_SHOWS (user dependent)
     - movies_list: list, containing the selected movie titles, defaults to None
+    - TMDB_TITLE_INDEX_PATH: string, path to the pickled index of the wanted titles; if given, titles are looked up
+    in the index, which is only built again when the export changes, instead of filtering the whole export,
+    defaults to None
+    - TMDB_MATCH_TABLE_PATH: string, path to the json table of matched titles; if given together with the title index,
+    titles without an exact match are matched by their canonical form or by similarity (see title_matching), and the
+    matches are saved so they are only computed once, defaults to None
 
     Returns:
     - selected_films_df: pandas dataframe with tmdb information on the films that are listed in the csv file or movies list.
@@ -75,11 +511,45 @@ def get_specific_movie_ids(TMDB_IDS_FILE_PATH, DATA_PATH_SHOWS, movies_list=None
 
     # Otherwise read in a df from a csv file and create the list
     else:
-        specific_movies_df = pd.read_csv(DATA_PATH_SHOWS, index_col=0)
-        specific_movies = specific_movies_df["movie"].unique()
+        if DATA_PATH_SHOWS.endswith(".parquet"):
+            specific_movies_df = pd.read_parquet(DATA_PATH_SHOWS, columns=["movie"])
+        else:
+            specific_movies_df = pd.read_csv(DATA_PATH_SHOWS, index_col=0)
+        specific_movies = list(specific_movies_df["movie"].unique())
+
+    # Look up each title in the prebuilt index
+    if TMDB_TITLE_INDEX_PATH:
+        # The index holds the wanted titles and their saved matches, new titles are matched while it is built
+        keys = {normalize_title(movie) for movie in specific_movies}
+        pending = []
+        if TMDB_MATCH_TABLE_PATH:
+            match_table = load_match_table(TMDB_MATCH_TABLE_PATH=TMDB_MATCH_TABLE_PATH)
+            keys.update(match_table[movie]["key"] for movie in specific_movies
+                        if movie in match_table and match_table[movie]["key"] is not None)
+            pending = pending_titles(titles=list(specific_movies), match_table=match_table,
+                                     export_version=tmdb_export_name())
+        title_index, matches, export_version = load_title_index(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH,
+                                                                TMDB_TITLE_INDEX_PATH=TMDB_TITLE_INDEX_PATH,
+                                                                keys=keys, pending=pending)
+        if TMDB_MATCH_TABLE_PATH:
+            resolved = resolve_titles(titles=list(specific_movies), title_index=title_index,
+                                      export_version=export_version, normalize=normalize_title,
+                                      match_table=match_table, matches=matches)
+            save_match_table(match_table=match_table, TMDB_MATCH_TABLE_PATH=TMDB_MATCH_TABLE_PATH)
+        else:
+            resolved = {movie: normalize_title(movie) for movie in specific_movies}
+        selected_films = []
+        for movie in specific_movies:
+            entry = title_index.get(resolved[movie])
+            if entry is not None and entry[0] is not None:
+                selected_films.append({"adult": entry[2], "id": entry[0], "original_title": movie,
+                                       "popularity": entry[1], "video": entry[3]})
+        selected_films_df = pd.DataFrame(selected_films, columns=TMDB_EXPORT_COLUMNS)
+
+        return selected_films_df
 
     # Download the file with all the movie IDs from tmdb
-    tmdb_ids_df = fetch_tmdb_movie_ids(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH)
+    tmdb_ids_df = fetch_tmdb_movie_ids(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH, titles=specific_movies)
     specific_movie_id_df = tmdb_ids_df[tmdb_ids_df["original_title"].isin(specific_movies)].reset_index(drop=True)
 
     # Some of the movie titles appear more than once with different IDs - need to take only the most recent one (highest popularity score)
@@ -94,13 +564,14 @@ def get_specific_movie_ids(TMDB_IDS_FILE_PATH, DATA_PATH_SHOWS, movies_list=None
     if selected_films:
         selected_films_df = pd.concat(selected_films).reset_index(drop=True)
     else:
-        selected_films_df = pd.DataFrame({"adult": [], "id": [], "original_title": [], "popularity": [], "video": []})
+        selected_films_df = pd.DataFrame({column: [] for column in TMDB_EXPORT_COLUMNS})
 
     return selected_films_df
 
 
 def get_specific_movie_overviews(TMDB_IDS_FILE_PATH, TMDB_CREDENTIALS_PATH, DATA_PATH_SHOWS,
-                                 movies_list=None):
+                                 movies_list=None, api_url=TMDB_API_URL, TMDB_CACHE_PATH=None,
+                                 TMDB_TITLE_INDEX_PATH=None, TMDB_MATCH_TABLE_PATH=None):
     """
     This function takes in a directory, the path to a csv file or a list of movie titles and the path to the tmbd api credentials.
     It downloads and saves the main json file with movie IDs from tmdb in the specified directory.
@@ -112,35 +583,43 @@ def get_specific_movie_overviews(TMDB_IDS_FILE_PATH, TMDB_CREDENTIALS_PATH, DATA
     - csv_path: string, the path to a csv file with movie titles (will be read in), defaults to ../data/raw/specific_movies.csv
     - movies_list: list, containing the selected movie titles, defaults to None
     - credentials_path: string, path to the file in which the tmdb api credentials are saved, defaults to ../tmdb_credentials.yml.
+    - api_url: string, the base url of the tmdb api, defaults to TMDB_API_URL
+    - TMDB_CACHE_PATH: string, path to the json file with cached api responses, defaults to None (no caching)
+    - TMDB_TITLE_INDEX_PATH: string, path to the pickled index of the wanted titles, defaults to None (filter the
+    whole export)
+    - TMDB_MATCH_TABLE_PATH: string, path to the json table of matched titles, defaults to None (exact matches only)
 
     Returns:
     - movies_overviews_df: pandas dataframe with information on the selected movies, including the overviews
     """
     # Load the DF with the specified movie titles and IDs
     selected_films_df = get_specific_movie_ids(TMDB_IDS_FILE_PATH=TMDB_IDS_FILE_PATH, DATA_PATH_SHOWS=DATA_PATH_SHOWS,
-                                               movies_list=movies_list)
+                                               movies_list=movies_list, TMDB_TITLE_INDEX_PATH=TMDB_TITLE_INDEX_PATH,
+                                               TMDB_MATCH_TABLE_PATH=TMDB_MATCH_TABLE_PATH)
 
     # load the API credentials
     key_yml = json.load(open(TMDB_CREDENTIALS_PATH))
     tmdb_api_key = key_yml["api_key"]
 
-    # take only the movie ids column
-    current_ids = selected_films_df["id"]
+    # request info for all movies concurrently and store the movie overviews in lists
+    # (only movies that are new or whose cache entry expired are requested from the api)
+    cache = load_tmdb_cache(TMDB_CACHE_PATH=TMDB_CACHE_PATH) if TMDB_CACHE_PATH else None
+    movie_jsons = fetch_all_movie_details(movie_ids=list(selected_films_df["id"]), api_key=tmdb_api_key,
+                                          api_url=api_url, cache=cache)
+    if cache is not None:
+        save_tmdb_cache(cache=cache, TMDB_CACHE_PATH=TMDB_CACHE_PATH)
     taglines = []
     overviews = []
     movie_genres = []
 
-    # request info for each movie and store the movie overviews in a list
-    for movie_id in current_ids:
-        url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key="
-        req = requests.get(url + tmdb_api_key)
-        movie_json = req.json()
+    for movie_json in movie_jsons:
         taglines.append(movie_json["tagline"])
         overviews.append(movie_json["overview"])
         genres = []
         for genre in movie_json["genres"]:
             genres.append(genre["name"])
-        genre_string = " ".join(genres)
+        # Genre names can contain spaces ("Science Fiction"), so they are separated by "|"
+        genre_string = "|".join(genres)
         movie_genres.append(genre_string)
 
     # create the new dataframe with the movie overviews column
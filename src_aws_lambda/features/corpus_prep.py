@@ -2,6 +2,8 @@ import pandas as pd
 import json
 import numpy as np
 import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import contractions
 import nltk
 nltk.download('stopwords')
@@ -17,7 +19,7 @@ def get_movie_genres(movies_df):
     - movies_df: a dataframe with movie information
 
     Returns:
-    - movie_genres: list of strings, contains movie genres for each movie
+    - movie_genres: list of strings, contains the "|"-separated movie genres for each movie
     """
     movie_genres = []
     for i in range(len(movies_df)):
@@ -26,7 +28,7 @@ def get_movie_genres(movies_df):
         for genre in genre_list:
             genres.append(genre["name"])
 
-        genre_string = " ".join(genres)
+        genre_string = "|".join(genres)
         movie_genres.append(genre_string)
     return movie_genres
 
@@ -50,13 +52,13 @@ def prepare_movie_descriptions(df):
     df_2 = df.copy()
     df_2 = df_2.loc[df_2["overview"].notna()]
     df_2["tagline"] = df_2["tagline"].fillna("")
-    df_2["genres_string"] = df_2["genres_string"].fillna("")
+    df_2["genres_string"] = df_2["genres_string"].fillna("").str.replace("|", " ", regex=False)
     df_2["description"] = df_2["tagline"] + " " + df_2["overview"] + " " + df_2["genres_string"]
     df_2 = df_2[["original_title", "description"]]
     return df_2
 
 
-stop_words_eng = nltk.corpus.stopwords.words('english')
+stop_words_eng = frozenset(nltk.corpus.stopwords.words('english'))
 
 
 def normalize_document(doc, stop_words=stop_words_eng):
@@ -77,14 +79,83 @@ def normalize_document(doc, stop_words=stop_words_eng):
     return doc
 
 
-normalize_corpus = np.vectorize(normalize_document)
+def hash_description(doc):
+    return hashlib.sha1(doc.encode("utf-8")).hexdigest()
 
 
-def generate_movie_corpus(old_movies_desc, recent_movies_desc):
+def load_normalization_cache(cache_path):
+    """
+    This function loads the normalized descriptions from earlier runs.
+
+    Required arguments:
+    - cache_path: string, path to the csv file with the cached descriptions
+
+    Returns:
+    - norm_cache: dictionary mapping the hash of a raw description to its normalized version, empty if the file
+    doesn't exist yet
+    """
+    try:
+        cache_df = pd.read_csv(cache_path, keep_default_na=False, dtype=str)
+    except FileNotFoundError:
+        return dict()
+
+    return dict(zip(cache_df["description_hash"], cache_df["normalized"]))
+
+
+def save_normalization_cache(norm_cache, cache_path):
+    cache_df = pd.DataFrame({"description_hash": list(norm_cache.keys()), "normalized": list(norm_cache.values())})
+    cache_df.to_csv(cache_path, index=False)
+
+
+def normalize_corpus(docs, norm_cache=None, processes=None, min_docs_per_pool=500):
+    """
+    This function normalizes a list of documents. Documents that are already in the cache are not processed again,
+    the rest is normalized on a process pool (or in this process, if there are only a few of them).
+
+    Required arguments:
+    - docs: list of strings, the raw documents
+
+    Optional arguments:
+    - norm_cache: dictionary mapping description hashes to normalized descriptions, new entries are added in place,
+    defaults to None (no caching)
+    - processes: int, number of worker processes, defaults to the number of CPUs
+    - min_docs_per_pool: int, below this number of uncached documents no pool is started, defaults to 500
+
+    Returns:
+    - norm_docs: numpy array of strings, the normalized documents in the same order
+    """
+    if norm_cache is None:
+        norm_cache = dict()
+
+    doc_hashes = [hash_description(doc) for doc in docs]
+    missing = dict()
+    for doc_hash, doc in zip(doc_hashes, docs):
+        if doc_hash not in norm_cache:
+            missing[doc_hash] = doc
+
+    if missing:
+        missing_docs = list(missing.values())
+        if len(missing_docs) >= min_docs_per_pool and processes != 1:
+            try:
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    normalized = list(executor.map(normalize_document, missing_docs, chunksize=64))
+            # Some environments (e.g. AWS Lambda) don't support the semaphores a process pool needs
+            except OSError:
+                normalized = [normalize_document(doc) for doc in missing_docs]
+        else:
+            normalized = [normalize_document(doc) for doc in missing_docs]
+        norm_cache.update(zip(missing.keys(), normalized))
+
+    norm_docs = np.array([norm_cache[doc_hash] for doc_hash in doc_hashes])
+
+    return norm_docs
+
+
+def generate_movie_corpus(old_movies_desc, recent_movies_desc, norm_cache=None):
     old_movies_desc_corp = prepare_movie_descriptions(old_movies_desc)
     recent_movies_desc_corp = prepare_movie_descriptions(recent_movies_desc)
     all_movies_corpus = pd.concat([old_movies_desc_corp, recent_movies_desc_corp]).drop_duplicates(
         "original_title", keep="last").reset_index(drop=True)
-    norm_movie_desc = normalize_corpus(list(all_movies_corpus["description"]))
+    norm_movie_desc = normalize_corpus(list(all_movies_corpus["description"]), norm_cache=norm_cache)
 
     return all_movies_corpus, norm_movie_desc
@@ -19,9 +19,12 @@ def scraper():
     logger = logging.getLogger(__name__)
 
     # Defining file paths
-    data_path_shows = f"s3://zmr-streamlit-aws/data/raw/{date.today()}_showtimes.csv"
+    data_path_showtimes = "s3://zmr-streamlit-aws/data/raw/showtimes"
     data_path_desc = f"s3://zmr-streamlit-aws/data/raw/{date.today()}_zurich_movie_overviews.csv"
     tmdb_ids_file_path = "s3://zmr-streamlit-aws/data/external/tmdb_id_file.gz"
+    tmdb_cache_path = "s3://zmr-streamlit-aws/data/external/tmdb_movie_cache.json"
+    tmdb_title_index_path = "s3://zmr-streamlit-aws/data/external/tmdb_title_index.pkl"
+    tmdb_match_table_path = "s3://zmr-streamlit-aws/data/external/tmdb_title_matches.json"
 
     # Getting credentials
     tmdb_credentials_path = os.getenv("TMDB_CREDENTIALS_PATH")
@@ -31,22 +34,24 @@ def scraper():
     fs = s3fs.S3FileSystem(anon=False)
 
     # Scraping the most recent data and saving it
-    content = cs.scrape_cineman(cities=("Zürich"))
-    movie_program_df = cs.format_cineman_content(html_content=content)
+    movie_program_df = cs.scrape_cities(cities=("Zürich",))
     cineman_df = cs.add_theatre_coordinates(showtimes_df=movie_program_df)
-    cineman_df.to_csv(data_path_shows)
+    data_path_shows = cs.save_showtimes(showtimes_df=cineman_df, dataset_path=data_path_showtimes)
     logger.info('First data file saved to bucket')
 
     # Requesting movie overviews via the tmdb api and saving them
     movie_desc = get_specific_movie_overviews(TMDB_IDS_FILE_PATH=tmdb_ids_file_path,
                                               TMDB_CREDENTIALS_PATH=tmdb_credentials_path,
                                               DATA_PATH_SHOWS=data_path_shows,
-                                              movies_list=None)
+                                              movies_list=None,
+                                              TMDB_CACHE_PATH=tmdb_cache_path,
+                                              TMDB_TITLE_INDEX_PATH=tmdb_title_index_path,
+                                              TMDB_MATCH_TABLE_PATH=tmdb_match_table_path)
     movie_desc.to_csv(data_path_desc)
     logger.info('Second data file saved to bucket')
 
     # Create the new corpus and retrain the model
-    data_path_doc_sims = "s3://zmr-streamlit-aws/models/document_similarities.csv"
+    models_path = "s3://zmr-streamlit-aws/models"
     data_path_comb_corpus = "s3://zmr-streamlit-aws/data/processed/comb_movie_corpus.csv"
 
 
@@ -62,19 +67,49 @@ def scraper():
         movie_desc_750 = cp.process_kaggle_tmdb_dataset(kaggle_file=movies_kaggle)
         movie_desc_750.to_csv(data_path_750_proc)
 
-    # Create the corpus
+    # Create the corpus, normalizing only descriptions that weren't normalized in an earlier run
+    data_path_norm_cache = "s3://zmr-streamlit-aws/data/processed/normalized_descriptions.csv"
+    norm_cache = cp.load_normalization_cache(cache_path=data_path_norm_cache)
+    num_cached = len(norm_cache)
     all_movies_corpus, norm_movie_desc = cp.generate_movie_corpus(old_movies_desc=movie_desc_750,
-                                                               recent_movies_desc=movie_desc)
+                                                               recent_movies_desc=movie_desc,
+                                                               norm_cache=norm_cache)
     all_movies_corpus.to_csv(data_path_comb_corpus)
-
-    # Tokenize the corpus and train the model
-    tokenized_docs, ft_model = rf.train_ft_model(norm_movie_desc)
-    logger.info("Model training finished")
-
-    # Calculate document vectors and similarities
-    doc_similarities = rf.calc_cosine_similarity(corpus=tokenized_docs, model=ft_model, num_features=300)
-    doc_similarities.to_csv(data_path_doc_sims)
-    logger.info('Document similarity matrix saved to bucket')
+    if len(norm_cache) > num_cached:
+        cp.save_normalization_cache(norm_cache=norm_cache, cache_path=data_path_norm_cache)
+    logger.info(f'{len(norm_cache) - num_cached} new descriptions normalized')
+
+    # Tokenize the corpus and update the model (or retrain it from scratch if it's due)
+    tokenized_docs, ft_model, full_retrain = rf.retrain_ft_model(fs=fs, models_path=models_path,
+                                                                 norm_movie_desc=norm_movie_desc)
+    logger.info(f"Model training finished ({'full' if full_retrain else 'incremental'})")
+
+    # Calculate document vectors and the nearest recent movies for every document
+    recent_movie_idx = all_movies_corpus[all_movies_corpus["original_title"].isin(movie_desc["original_title"])].index
+    document_vectors, neighbour_idx, neighbour_sims, doc_hashes, num_embedded = rf.update_neighbour_index(
+        fs=fs, models_path=models_path, titles=list(all_movies_corpus["original_title"]),
+        tokenized_docs=tokenized_docs, model=ft_model, num_features=300, candidate_idx=recent_movie_idx,
+        full_retrain=full_retrain)
+    logger.info(f'{num_embedded} documents embedded')
+    # Optionally store the document vectors as float32 or int8, after checking how many neighbours that loses
+    vector_precision = os.getenv("VECTOR_PRECISION", "float64")
+    if vector_precision != "float64":
+        compact_vectors, _ = rf.quantize_vectors(vectors=document_vectors, precision=vector_precision)
+        recall = rf.neighbour_recall(document_vectors=document_vectors, compact_vectors=compact_vectors,
+                                     candidate_idx=recent_movie_idx)
+        logger.info(f'Neighbour recall with {vector_precision} vectors: {recall:.3f}')
+    rf.save_model_artifacts(fs=fs, models_path=models_path, titles=all_movies_corpus["original_title"],
+                            document_vectors=document_vectors, neighbour_idx=neighbour_idx,
+                            neighbour_sims=neighbour_sims, doc_hashes=doc_hashes, candidate_idx=recent_movie_idx,
+                            precision=vector_precision)
+    logger.info('Document vectors and neighbour index saved to bucket')
+
+    # Precompute the recommendations for every title, so the app only has to look them up
+    data_path_recs = f"s3://zmr-streamlit-aws/models/{date.today()}_recommendations.json"
+    recommendations = rf.build_recommendation_table(titles=all_movies_corpus["original_title"],
+                                                    neighbour_idx=neighbour_idx, neighbour_sims=neighbour_sims)
+    rf.save_recommendation_table(fs=fs, data_path_recs=data_path_recs, recommendations=recommendations)
+    logger.info('Recommendation table saved to bucket')
 
 
 if __name__ == '__main__':
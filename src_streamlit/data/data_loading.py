@@ -0,0 +1,185 @@
+import os
+import json
+import tempfile
+import time
+import threading
+import numpy as np
+import pandas as pd
+import s3fs
+import streamlit as st
+from datetime import date, timedelta
+
+from data.showtimes_query import add_hour_bucket, build_showtimes_index
+from visualization.plotting_functions import build_overview_store
+
+
+DATA_PATH = "s3://zmr-streamlit-aws/data"
+MODELS_PATH = "s3://zmr-streamlit-aws/models"
+SHOWTIMES_PATH = f"{DATA_PATH}/raw/showtimes"
+LOCAL_CACHE_DIR = os.path.join(tempfile.gettempdir(), "zmr_cache")
+
+# The data of the most recent day, keyed by day and shared by all sessions of this process
+app_data_cache = dict()
+app_data_lock = threading.Lock()
+
+
+def load_model_artifacts(fs, models_path, cache_dir=LOCAL_CACHE_DIR, max_attempts=5, retry_wait=10):
+    """
+    This function copies the binary model artifacts from the bucket into a local cache directory and memory-maps them.
+    The arrays are only downloaded again when the json sidecar in the bucket has changed. Arrays whose shape or dtype
+    don't match the sidecar are being replaced by the daily pipeline, which writes the sidecar last, so they are
+    downloaded again with the new sidecar after a short wait.
+
+    Required arguments:
+    - fs: filesystem object (e.g. s3fs.S3FileSystem) used to read the files
+    - models_path: string, the folder in which the artifacts are saved
+
+    Optional arguments:
+    - cache_dir: string, the local folder for the cached artifacts, defaults to LOCAL_CACHE_DIR
+    - max_attempts: integer, number of times the artifacts are read before giving up, defaults to 5
+    - retry_wait: float, seconds to wait between two attempts, defaults to 10
+
+    Returns:
+    - titles: list of strings, the movie titles in the same order as the rows of the arrays
+    - arrays: dictionary of read-only memory-mapped numpy arrays, keyed by artifact name
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    local_sidecar_path = os.path.join(cache_dir, "model_artifacts.json")
+
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(retry_wait)
+        fs.invalidate_cache(models_path)
+        with fs.open(f"{models_path}/model_artifacts.json") as f:
+            sidecar = json.load(f)
+
+        cached_sidecar = None
+        if os.path.exists(local_sidecar_path):
+            with open(local_sidecar_path) as f:
+                cached_sidecar = json.load(f)
+
+        if cached_sidecar != sidecar:
+            for name in sidecar["arrays"]:
+                local_path = os.path.join(cache_dir, f"{name}.npy")
+                # Download next to the old file and swap, so arrays that are still mapped are never truncated
+                fs.get(f"{models_path}/{name}.npy", local_path + ".tmp")
+                os.replace(local_path + ".tmp", local_path)
+
+        arrays = {name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r") for name in sidecar["arrays"]}
+        if all(list(arrays[name].shape) == list(spec["shape"]) and str(arrays[name].dtype) == spec["dtype"]
+               for name, spec in sidecar["arrays"].items()):
+            # The sidecar is only cached once its arrays are complete, so a partial download is never reused
+            with open(local_sidecar_path, "w") as f:
+                json.dump(sidecar, f)
+            return sidecar["titles"], arrays
+        if os.path.exists(local_sidecar_path):
+            os.remove(local_sidecar_path)
+
+    raise RuntimeError(f"The model artifacts in {models_path} don't match their sidecar, they are still being written")
+
+
+def load_showtimes(fs, days, columns=None, dataset_path=SHOWTIMES_PATH):
+    """
+    This function reads the showtimes of the given days from the Parquet dataset, which is partitioned by date, so
+    only the files of those days are scanned. Days from before the dataset existed are read from the old csv files.
+
+    Required arguments:
+    - fs: filesystem object (e.g. s3fs.S3FileSystem) used to check which partitions exist
+    - days: list of strings, the dates to load (YYYY-MM-DD)
+
+    Optional arguments:
+    - columns: list of strings, the columns to read, defaults to None (all columns)
+    - dataset_path: string, the root folder of the dataset, defaults to SHOWTIMES_PATH
+
+    Returns:
+    - showtimes_df: pandas DataFrame with categorical text columns, datetime64 showtimes and float32 coordinates
+    """
+    parquet_days = [day for day in days if fs.exists(f"{dataset_path}/date={day}")]
+    frames = []
+    if parquet_days:
+        frames.append(pd.read_parquet(dataset_path, columns=columns, filters=[("date", "in", parquet_days)]))
+    for day in days:
+        if day not in parquet_days:
+            csv_df = pd.read_csv(f"{DATA_PATH}/raw/{day}_showtimes.csv", index_col=0, parse_dates=["dt_showtime"])
+            frames.append(csv_df if columns is None else csv_df[columns])
+
+    showtimes_df = pd.concat(frames, ignore_index=True)
+    for column in showtimes_df.columns:
+        if showtimes_df[column].dtype == object:
+            showtimes_df[column] = showtimes_df[column].astype("category")
+    for column in ["latitude", "longitude"]:
+        if column in showtimes_df.columns:
+            showtimes_df[column] = showtimes_df[column].astype("float32")
+
+    return showtimes_df
+
+
+@st.experimental_memo(ttl=600)
+def latest_data_day():
+    """
+    Returns the most recent day (as string) for which all the data is in the bucket: today, once the daily pipeline
+    has saved the recommendation table, which it writes last, otherwise yesterday. The answer is cached for 10
+    minutes, so the bucket isn't checked on every rerun.
+    """
+    fs = s3fs.S3FileSystem(anon=False)
+    today = date.today()
+    fs.invalidate_cache(MODELS_PATH)
+    if fs.exists(f"{MODELS_PATH}/{today}_recommendations.json"):
+        return str(today)
+
+    return str(today - timedelta(days=1))
+
+
+def load_app_data(day):
+    """
+    This function loads all the data the app needs for one day. It is called through get_app_data, which caches the
+    result once per process and shares it between all sessions.
+
+    Required arguments:
+    - day: string, the date of the scraped data (YYYY-MM-DD)
+
+    Returns:
+    - app_data: dictionary with the showtimes and their index by time window and movie, the movie overviews and their
+    rendered descriptions by title, the title index, the model arrays and the recommendation table
+    """
+    fs = s3fs.S3FileSystem(anon=False)
+
+    # Load saved data on movies currently running in Zurich
+    cineman_df = add_hour_bucket(load_showtimes(fs=fs, days=[day]))
+    showtimes_index = build_showtimes_index(cineman_df)
+    movie_desc = pd.read_csv(f"{DATA_PATH}/raw/{day}_zurich_movie_overviews.csv")
+    overview_store = build_overview_store(movie_desc)
+
+    # Load the title index, the document neighbour index and the precomputed recommendations
+    titles, model_arrays = load_model_artifacts(fs=fs, models_path=MODELS_PATH)
+    all_movies_corpus = pd.DataFrame({"original_title": titles})
+    with fs.open(f"{MODELS_PATH}/{day}_recommendations.json") as f:
+        recommendations = json.load(f)
+
+    app_data = {
+        "day": day,
+        "cineman_df": cineman_df,
+        "showtimes_index": showtimes_index,
+        "movie_desc": movie_desc,
+        "overview_store": overview_store,
+        "all_movies_corpus": all_movies_corpus,
+        "model_arrays": model_arrays,
+        "recommendations": recommendations
+    }
+
+    return app_data
+
+
+def get_app_data():
+    """
+    Returns the cached data of the most recent day, keyed by the day. When a new day's files appear, they are loaded
+    once and replace the data of the previous day in the cache.
+    """
+    day = latest_data_day()
+    with app_data_lock:
+        if day not in app_data_cache:
+            app_data = load_app_data(day)
+            app_data_cache.clear()
+            app_data_cache[day] = app_data
+
+        return app_data_cache[day]
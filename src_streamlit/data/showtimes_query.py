@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+
+# Start and end hour of the time windows that can be selected in the app, a showtime belongs to the window in which
+# it starts (start hour included, end hour excluded)
+HOUR_WINDOWS = {
+    "9-12am": (9, 12),
+    "12-3pm": (12, 15),
+    "3-6pm": (15, 18),
+    "6-9pm": (18, 21),
+    "9-12pm": (21, 24)
+}
+HOUR_LABELS = list(HOUR_WINDOWS)
+
+# Hour bucket for each hour of the day, -1 for hours outside of all windows
+HOUR_TO_BUCKET = np.full(24, -1, dtype="int8")
+for bucket, (start_hour, end_hour) in enumerate(HOUR_WINDOWS.values()):
+    HOUR_TO_BUCKET[start_hour:end_hour] = bucket
+
+
+def add_hour_bucket(showtimes_df):
+    """
+    This function adds an integer column "hour_bucket" with the position of each showtime's time window in
+    HOUR_LABELS (-1 if the showtime is outside of all windows).
+
+    Required arguments:
+    - showtimes_df: pandas DataFrame with a "dt_showtime" column
+
+    Returns:
+    - showtimes_df: the same DataFrame with the additional column
+    """
+    hours = pd.to_datetime(showtimes_df["dt_showtime"]).dt.hour.to_numpy()
+    showtimes_df["hour_bucket"] = HOUR_TO_BUCKET[hours]
+
+    return showtimes_df
+
+
+def build_showtimes_index(showtimes_df):
+    """
+    This function groups the row positions of the showtimes by time window and movie, once per loaded dataset, so
+    every combination of filters in the app is a single dictionary lookup.
+
+    Required arguments:
+    - showtimes_df: pandas DataFrame with "movie" and "hour_bucket" columns
+
+    Returns:
+    - showtimes_index: dictionary with (hour, movie) tuples as keys, where hour is "All" or one of HOUR_LABELS and
+    movie is "All" or a movie title, and sorted arrays of row positions as values
+    """
+    showtimes_index = {("All", "All"): np.arange(len(showtimes_df))}
+    hour_buckets = showtimes_df["hour_bucket"]
+
+    for movie, rows in showtimes_df.groupby("movie", observed=True).indices.items():
+        showtimes_index[("All", movie)] = rows
+    for bucket, rows in showtimes_df.groupby(hour_buckets).indices.items():
+        if bucket >= 0:
+            showtimes_index[(HOUR_LABELS[bucket], "All")] = rows
+    for (bucket, movie), rows in showtimes_df.groupby([hour_buckets, "movie"], observed=True).indices.items():
+        if bucket >= 0:
+            showtimes_index[(HOUR_LABELS[bucket], movie)] = rows
+
+    return showtimes_index
+
+
+def query_showtimes(showtimes_df, showtimes_index, hour="All", movie="All"):
+    """
+    Returns the showtimes of a movie (or all movies) within a time window (or the whole day), looked up in the index
+    built by build_showtimes_index.
+    """
+    rows = showtimes_index.get((hour, movie), np.empty(0, dtype="int64"))
+
+    return showtimes_df.iloc[rows]
+
+
+def movies_by_hour(showtimes_index, hour="All"):
+    """
+    Returns the sorted titles of the movies with at least one showtime in the time window.
+    """
+    return sorted(movie for index_hour, movie in showtimes_index if index_hour == hour and movie != "All")
@@ -1,58 +1,613 @@
 from gensim.models import FastText
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from scipy.sparse import csr_matrix
+import json
+import pickle
+import hashlib
+from datetime import date
+
+
+# Number of hash buckets for the character n-grams. The n-gram vectors take bucket * vector_size * 4 bytes, i.e.
+# about 240 MB instead of 2.4 GB with the gensim default of 2,000,000, which is far more than the corpus needs
+FT_BUCKET = 200000
 
 
 def train_ft_model(norm_movie_desc):
     tokenized_docs = [doc.split() for doc in norm_movie_desc]
-    ft_model = FastText(tokenized_docs, vector_size=300, window=30, min_count=2, workers=4, sg=1, epochs=50)
+    ft_model = FastText(tokenized_docs, vector_size=300, window=30, min_count=2, workers=4, sg=1, epochs=50,
+                        bucket=FT_BUCKET)
 
     return tokenized_docs, ft_model
 
 
-def averaged_word2vec_vectorizer(corpus, model, num_features):
+def update_ft_model(ft_model, new_tokenized_docs):
+    """
+    Continues training an existing model on new documents only. New words are added to the vocabulary first.
+    """
+    ft_model.build_vocab(new_tokenized_docs, update=True)
+    ft_model.train(new_tokenized_docs, total_examples=len(new_tokenized_docs), epochs=ft_model.epochs)
+
+    return ft_model
+
+
+def vocabulary_drift(ft_model, tokenized_docs):
+    """
+    Share of the distinct words in tokenized_docs that are not in the vocabulary of the model.
+    """
+    words = set(word for doc in tokenized_docs for word in doc)
+    if not words:
+        return 0.
+    new_words = [word for word in words if word not in ft_model.wv.key_to_index]
+
+    return len(new_words) / len(words)
+
+
+def save_ft_model(fs, models_path, ft_model, state):
+    """
+    Saves the model and a json file with the training state (date of the last full training, hashes of the
+    documents the model has seen) into models_path/ft_model. The model is pickled straight into the bucket, so no
+    local copy is written (the Lambda's /tmp is too small for it). The state is written last and marks a complete
+    model.
+    """
+    with fs.open(f"{models_path}/ft_model/ft_model.pkl", "wb") as f:
+        ft_model.save(f)
+    with fs.open(f"{models_path}/ft_model/ft_model_state.json", "w") as f:
+        json.dump(state, f)
+
+
+def load_ft_model(fs, models_path):
+    """
+    Loads the model and training state saved by save_ft_model, streamed from the bucket. Returns (None, None) if
+    there is no saved model yet. gensim's load only accepts file names, so the model is unpickled straight from the
+    stream, which is how save_ft_model wrote it.
+    """
+    if not fs.exists(f"{models_path}/ft_model/ft_model_state.json") or \
+            not fs.exists(f"{models_path}/ft_model/ft_model.pkl"):
+        return None, None
+    with fs.open(f"{models_path}/ft_model/ft_model_state.json") as f:
+        state = json.load(f)
+    with fs.open(f"{models_path}/ft_model/ft_model.pkl", "rb") as f:
+        ft_model = pickle.load(f)
+
+    return ft_model, state
+
+
+def retrain_ft_model(fs, models_path, norm_movie_desc, full_retrain_days=7, max_vocab_drift=0.25):
+    """
+    This function loads the previously trained model and continues training it on the documents it hasn't seen yet.
+    The model is trained from scratch instead if there is no saved model, if the last full training is at least
+    full_retrain_days old or if the share of new words in the new documents is above max_vocab_drift.
+
+    Required arguments:
+    - fs: filesystem object (e.g. s3fs.S3FileSystem) used to read and write the model
+    - models_path: string, the folder in which the model is saved
+    - norm_movie_desc: list of strings, the normalized movie descriptions
+
+    Optional arguments:
+    - full_retrain_days: int, maximum number of days between two full trainings, defaults to 7
+    - max_vocab_drift: float, maximum share of new words before a full training is triggered, defaults to 0.25
+
+    Returns:
+    - tokenized_docs: list of lists of strings, the tokenized documents
+    - ft_model: the trained FastText model
+    - full_retrain: boolean, True if the model was trained from scratch
+    """
+    tokenized_docs = [doc.split() for doc in norm_movie_desc]
+    doc_hashes = [hashlib.sha1(doc.encode("utf-8")).hexdigest() for doc in norm_movie_desc]
+
+    ft_model, state = load_ft_model(fs=fs, models_path=models_path)
+    new_docs = []
+    full_retrain = ft_model is None or \
+        (date.today() - date.fromisoformat(state["last_full_train"])).days >= full_retrain_days
+
+    if not full_retrain:
+        seen_hashes = set(state["doc_hashes"])
+        new_docs = [doc for doc, doc_hash in zip(tokenized_docs, doc_hashes) if doc_hash not in seen_hashes]
+        full_retrain = vocabulary_drift(ft_model=ft_model, tokenized_docs=new_docs) > max_vocab_drift
+
+    if full_retrain:
+        tokenized_docs, ft_model = train_ft_model(norm_movie_desc)
+        state = {"last_full_train": str(date.today()), "doc_hashes": doc_hashes}
+    elif new_docs:
+        ft_model = update_ft_model(ft_model=ft_model, new_tokenized_docs=new_docs)
+        state["doc_hashes"] = sorted(seen_hashes.union(doc_hashes))
+
+    if full_retrain or new_docs:
+        save_ft_model(fs=fs, models_path=models_path, ft_model=ft_model, state=state)
+
+    return tokenized_docs, ft_model, full_retrain
+
+
+def averaged_word2vec_vectorizer(corpus, model, num_features, dtype="float64"):
+    """
+    Turns word level embeddings into document embeddings. The corpus is flattened and all tokens are mapped to their
+    vocabulary index in one lookup, then the word vectors are summed per document with a single sparse
+    document-term matrix product. Use dtype="float32" for a result that takes half the memory.
+    """
+    doc_lengths = np.fromiter((len(words) for words in corpus), dtype="int64", count=len(corpus))
+    tokens = [word for words in corpus for word in words]
+    token_idx = pd.Index(model.wv.index_to_key).get_indexer(tokens)
+
+    # Drop the out-of-vocabulary tokens (-1) and count the remaining ones per document
+    in_vocab = token_idx >= 0
+    token_docs = np.repeat(np.arange(len(corpus)), doc_lengths)
+    doc_counts = np.bincount(token_docs[in_vocab], minlength=len(corpus))
+    doc_offsets = np.concatenate([[0], np.cumsum(doc_counts)])
+    token_idx = token_idx[in_vocab]
+
+    word_vectors = model.wv.vectors[:, :num_features].astype(dtype, copy=False)
+    doc_term_matrix = csr_matrix((np.ones(len(token_idx), dtype=dtype), token_idx, doc_offsets),
+                                 shape=(len(corpus), len(word_vectors)))
+    features = np.asarray(doc_term_matrix @ word_vectors)
+
+    nwords = doc_counts.astype(dtype)
+    nwords[nwords == 0] = 1.
+
+    return features / nwords[:, None]
+
+
+def quantize_vectors(vectors, precision="float64"):
+    """
+    This function turns document vectors into a more compact representation.
+    - "float64": the vectors are returned unchanged
+    - "float32": the L2-normalized vectors in single precision
+    - "int8": the L2-normalized vectors scaled to [-127, 127] per vector and rounded, plus the per-vector scales
+
+    Returns:
+    - compact_vectors: numpy array of shape (N, num_features)
+    - scales: numpy array of shape (N,) with the factors that turn the int8 vectors back into normalized vectors,
+    None for the other precisions
+    """
+    if precision == "float64":
+        return vectors, None
+    normalized = normalize_vectors(np.asarray(vectors, dtype="float64"))
+    if precision == "float32":
+        return normalized.astype("float32"), None
+    if precision == "int8":
+        scales = np.abs(normalized).max(axis=1) / 127.
+        scales[scales == 0] = 1.
+        compact_vectors = np.round(normalized / scales[:, None]).astype("int8")
+        return compact_vectors, scales.astype("float32")
+    raise ValueError(f"Unknown precision: {precision}")
+
+
+def dequantize_vectors(compact_vectors, scales=None):
+    """
+    Turns vectors stored by quantize_vectors back into float64 vectors.
+    """
+    vectors = np.asarray(compact_vectors, dtype="float64")
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype="float64")[:, None]
+    return vectors
+
+
+def neighbour_recall(document_vectors, compact_vectors, candidate_idx, k=10):
+    """
+    Share of the exact top-k neighbours (computed from the float64 document vectors) that are also found with the
+    compact vectors, averaged over all documents.
+    """
+    exact_idx, _ = build_neighbour_index(document_vectors=document_vectors, k=k, candidate_idx=candidate_idx)
+    compact_idx, _ = build_neighbour_index(document_vectors=dequantize_vectors(compact_vectors), k=k,
+                                           candidate_idx=candidate_idx)
+    found = [len(set(exact_row[exact_row >= 0]).intersection(compact_row)) for exact_row, compact_row in
+             zip(exact_idx, compact_idx)]
+    expected = (exact_idx >= 0).sum()
+
+    return sum(found) / expected if expected else 1.
+
+
+def save_model_artifacts(fs, models_path, titles, document_vectors, neighbour_idx, neighbour_sims, doc_hashes=None,
+                         candidate_idx=None, precision="float64"):
+    """
+    This function writes the document vectors and the neighbour index as binary .npy files and the title index as a
+    json sidecar, so that the app can memory-map them instead of parsing floats from csv.
+
+    Required arguments:
+    - fs: filesystem object (e.g. s3fs.S3FileSystem) used to write the files
+    - models_path: string, the folder in which the artifacts are saved
+    - titles: list of strings, the movie titles in the same order as the rows of the arrays
+    - document_vectors: numpy array of shape (N, num_features)
+    - neighbour_idx: numpy array of shape (N, k), row positions of the nearest neighbours
+    - neighbour_sims: numpy array of shape (N, k), similarities of the nearest neighbours
+
+    Optional arguments:
+    - doc_hashes: list of strings, hashes of the documents the vectors were computed from, defaults to None
+    - candidate_idx: array of the row positions the neighbours were drawn from, defaults to None
+    - precision: string, "float64", "float32" or "int8", how the document vectors are stored (see quantize_vectors),
+    defaults to "float64"
+
+    Returns:
+    - sidecar: dictionary with the content of the json sidecar
+    """
+    compact_vectors, scales = quantize_vectors(vectors=document_vectors, precision=precision)
+    arrays = {"document_vectors": compact_vectors, "neighbour_idx": neighbour_idx, "neighbour_sims": neighbour_sims}
+    if scales is not None:
+        arrays["document_vector_scales"] = scales
+    for name, array in arrays.items():
+        with fs.open(f"{models_path}/{name}.npy", "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+
+    sidecar = {
+        "created": str(date.today()),
+        "titles": [str(title) for title in titles],
+        "doc_hashes": list(doc_hashes) if doc_hashes is not None else None,
+        "candidate_idx": [int(idx) for idx in candidate_idx] if candidate_idx is not None else None,
+        "precision": precision,
+        "arrays": {name: {"shape": list(array.shape), "dtype": str(array.dtype)} for name, array in arrays.items()}
+    }
+    # The sidecar is written last, so it never points to arrays that are only half written
+    with fs.open(f"{models_path}/model_artifacts.json", "w") as f:
+        json.dump(sidecar, f)
+
+    return sidecar
+
+
+def load_model_artifacts(fs, models_path):
+    """
+    Reads the artifacts written by save_model_artifacts back into memory. Returns (None, None) if there are none yet.
+    """
+    if not fs.exists(f"{models_path}/model_artifacts.json"):
+        return None, None
+    with fs.open(f"{models_path}/model_artifacts.json") as f:
+        sidecar = json.load(f)
+    arrays = dict()
+    for name in sidecar["arrays"]:
+        with fs.open(f"{models_path}/{name}.npy", "rb") as f:
+            arrays[name] = np.load(f)
+
+    return sidecar, arrays
+
+
+def hash_tokenized_doc(words):
+    return hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+
+
+def normalize_vectors(vectors):
     """
-    Turns word level embeddings into document embeddings
+    Scales every row to unit length, so that dot products are cosine similarities. All-zero rows stay zero.
     """
-    model_vocab = set(model.wv.index_to_key)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.
 
-    def average_word_vectors(words, model, vocabulary, num_features):
-        feature_vector = np.zeros((num_features,), dtype="float64")
-        nwords = 0.
+    return vectors / norms
 
-        for word in words:
-            if word in vocabulary:
-                nwords = nwords + 1.
-                feature_vector = np.add(feature_vector, model.wv[word])
-        if nwords:
-            feature_vector = np.divide(feature_vector, nwords)
 
-        return feature_vector
+def top_k_neighbours(query_vectors, candidate_vectors, candidate_idx, k=10, batch_size=1024):
+    """
+    Exact top-k search of normalized query vectors against normalized candidate vectors, in blocks of batch_size
+    query rows. Returns the candidate_idx entries of the k best candidates per query row and their similarities,
+    padded with -1 and 0 if there are fewer than k candidates.
+    """
+    candidate_idx = np.asarray(candidate_idx, dtype="int64")
+    num_queries = len(query_vectors)
+    num_neighbours = min(k, len(candidate_idx))
+
+    neighbour_idx = np.full((num_queries, k), -1, dtype="int32")
+    neighbour_sims = np.zeros((num_queries, k), dtype="float32")
+
+    if num_neighbours:
+        for start in range(0, num_queries, batch_size):
+            block_sims = query_vectors[start:start + batch_size] @ candidate_vectors.T
+            top = np.argpartition(-block_sims, num_neighbours - 1, axis=1)[:, :num_neighbours]
+            top_sims = np.take_along_axis(block_sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            neighbour_idx[start:start + batch_size, :num_neighbours] = candidate_idx[top]
+            neighbour_sims[start:start + batch_size, :num_neighbours] = np.take_along_axis(top_sims, order, axis=1)
+
+    return neighbour_idx, neighbour_sims
+
+
+def merge_neighbours(neighbour_idx, neighbour_sims, other_idx, other_sims, k=10):
+    """
+    Merges two sorted neighbour lists per row into one sorted list of the k best entries. Entries with index -1 are
+    treated as empty.
+    """
+    all_idx = np.concatenate([neighbour_idx, other_idx], axis=1)
+    all_sims = np.concatenate([neighbour_sims, other_sims], axis=1).astype("float32")
+    all_sims[all_idx < 0] = -np.inf
+
+    order = np.argsort(-all_sims, axis=1, kind="stable")[:, :k]
+    merged_idx = np.take_along_axis(all_idx, order, axis=1)
+    merged_sims = np.take_along_axis(all_sims, order, axis=1)
+    empty = ~np.isfinite(merged_sims)
+    merged_idx[empty] = -1
+    merged_sims[empty] = 0.
+
+    return merged_idx, merged_sims
+
+
+def build_neighbour_index(document_vectors, k=10, candidate_idx=None, batch_size=1024):
+    """
+    Exact k-nearest-neighbour search over the normalized document vectors. Similarities are computed in blocks of
+    batch_size rows, so the full N x N matrix is never held in memory and the result grows linearly with N.
+
+    Required arguments:
+    - document_vectors: numpy array of shape (N, num_features)
+
+    Optional arguments:
+    - k: int, number of neighbours to keep per document, defaults to 10
+    - candidate_idx: array of row positions the neighbours are drawn from (e.g. the recent movies), defaults to all
+    - batch_size: int, number of query rows per block, defaults to 1024
+
+    Returns:
+    - neighbour_idx: numpy array of shape (N, k), the row positions of the neighbours sorted from most to least
+    similar (-1 if there are fewer than k candidates)
+    - neighbour_sims: numpy array of shape (N, k), the corresponding cosine similarities
+    """
+    vectors = normalize_vectors(np.asarray(document_vectors, dtype="float64"))
+    if candidate_idx is None:
+        candidate_idx = np.arange(len(vectors))
+    candidate_idx = np.asarray(candidate_idx, dtype="int64")
+
+    return top_k_neighbours(query_vectors=vectors, candidate_vectors=vectors[candidate_idx],
+                            candidate_idx=candidate_idx, k=k, batch_size=batch_size)
+
+
+def update_neighbour_index(fs, models_path, titles, tokenized_docs, model, num_features, candidate_idx,
+                           full_retrain=False, k=10):
+    """
+    This function updates the saved document vectors and neighbour index for today's corpus. Only documents that are
+    new (or whose text changed) are embedded. Their neighbour rows are computed from scratch, and the similarities
+    of all other rows to the new candidates are merged into the existing neighbour lists as one block. Titles that
+    left the corpus or the candidates are dropped. A saved list with k entries doesn't know the candidates ranked
+    below them, so rows that lost one of those entries are recomputed, which keeps every row the exact top k. If the
+    model was retrained from scratch or nothing is saved yet, everything is computed again.
+
+    Required arguments:
+    - fs: filesystem object (e.g. s3fs.S3FileSystem) used to read the saved artifacts
+    - models_path: string, the folder in which the artifacts are saved
+    - titles: list of strings, the movie titles of today's corpus
+    - tokenized_docs: list of lists of strings, the tokenized documents in the same order
+    - model: the trained FastText model
+    - num_features: int, the size of the document vectors
+    - candidate_idx: array of row positions the neighbours are drawn from (the recent movies)
+
+    Optional arguments:
+    - full_retrain: boolean, True if the model was trained from scratch, defaults to False
+    - k: int, number of neighbours to keep per document, defaults to 10
+
+    Returns:
+    - document_vectors: numpy array of shape (N, num_features)
+    - neighbour_idx: numpy array of shape (N, k)
+    - neighbour_sims: numpy array of shape (N, k)
+    - doc_hashes: list of strings, the hashes of the documents
+    - num_embedded: int, the number of documents that had to be embedded
+    """
+    doc_hashes = [hash_tokenized_doc(words) for words in tokenized_docs]
+    candidate_idx = np.asarray(candidate_idx, dtype="int64")
+    sidecar, arrays = (None, None) if full_retrain else load_model_artifacts(fs=fs, models_path=models_path)
+
+    if sidecar is None or sidecar.get("doc_hashes") is None or sidecar.get("candidate_idx") is None or \
+            arrays["document_vectors"].shape[1] != num_features or arrays["neighbour_idx"].shape[1] != k:
+        document_vectors = averaged_word2vec_vectorizer(corpus=tokenized_docs, model=model, num_features=num_features)
+        neighbour_idx, neighbour_sims = build_neighbour_index(document_vectors=document_vectors, k=k,
+                                                              candidate_idx=candidate_idx)
+        return document_vectors, neighbour_idx, neighbour_sims, doc_hashes, len(titles)
+
+    # Match today's documents to the saved rows by title and document hash
+    saved_rows = {key: row for row, key in enumerate(zip(sidecar["titles"], sidecar["doc_hashes"]))}
+    old_rows = np.array([saved_rows.get(key, -1) for key in zip(titles, doc_hashes)], dtype="int64")
+    kept = old_rows >= 0
+    kept_rows = np.where(kept)[0]
+    new_rows = np.where(~kept)[0]
+
+    # Reuse the saved vectors and only embed the new documents
+    saved_vectors = dequantize_vectors(arrays["document_vectors"], arrays.get("document_vector_scales"))
+    document_vectors = np.empty((len(titles), num_features), dtype="float64")
+    document_vectors[kept_rows] = saved_vectors[old_rows[kept_rows]]
+    if len(new_rows):
+        document_vectors[new_rows] = averaged_word2vec_vectorizer(corpus=[tokenized_docs[i] for i in new_rows],
+                                                                  model=model, num_features=num_features)
+    vectors = normalize_vectors(np.asarray(document_vectors, dtype="float64"))
+
+    # Translate the saved neighbours to today's row positions, dropping titles that are gone or no candidates anymore
+    new_positions = np.full(len(sidecar["titles"]), -1, dtype="int64")
+    new_positions[old_rows[kept_rows]] = kept_rows
+    is_candidate = np.zeros(len(titles), dtype=bool)
+    is_candidate[candidate_idx] = True
+
+    old_neighbours = arrays["neighbour_idx"][old_rows[kept_rows]]
+    kept_idx = np.where(old_neighbours >= 0, new_positions[old_neighbours], -1)
+    valid = kept_idx >= 0
+    valid[valid] = is_candidate[kept_idx[valid]]
+    kept_idx[~valid] = -1
+    lost_neighbours = kept_rows[(old_neighbours >= 0).all(axis=1) & ~valid.all(axis=1)]
+
+    # Merge in the block of kept rows x new candidates
+    old_candidates = new_positions[np.asarray(sidecar["candidate_idx"], dtype="int64")]
+    new_candidate_idx = np.setdiff1d(candidate_idx, old_candidates[old_candidates >= 0])
+    block_idx, block_sims = top_k_neighbours(query_vectors=vectors[kept_rows],
+                                             candidate_vectors=vectors[new_candidate_idx],
+                                             candidate_idx=new_candidate_idx, k=k)
+
+    neighbour_idx = np.full((len(titles), k), -1, dtype="int32")
+    neighbour_sims = np.zeros((len(titles), k), dtype="float32")
+    neighbour_idx[kept_rows], neighbour_sims[kept_rows] = merge_neighbours(
+        neighbour_idx=kept_idx, neighbour_sims=arrays["neighbour_sims"][old_rows[kept_rows]],
+        other_idx=block_idx, other_sims=block_sims, k=k)
+
+    # Compute the new rows and the rows whose full saved list lost a neighbour from scratch
+    recompute_rows = np.union1d(new_rows, lost_neighbours)
+    if len(recompute_rows):
+        neighbour_idx[recompute_rows], neighbour_sims[recompute_rows] = top_k_neighbours(
+            query_vectors=vectors[recompute_rows], candidate_vectors=vectors[candidate_idx],
+            candidate_idx=candidate_idx, k=k)
+
+    return document_vectors, neighbour_idx, neighbour_sims, doc_hashes, len(new_rows)
+
 
-    features = [average_word_vectors(words=tokenized_sentence, model=model,
-                                     vocabulary=model_vocab, num_features=num_features)
-                for tokenized_sentence in corpus]
+def build_recommendation_table(titles, neighbour_idx, neighbour_sims, k=5):
+    """
+    This function turns the neighbour index (whose candidates are the movies currently running) into a table of
+    the k best recommendations for every title, so that the app only has to look them up.
+
+    Required arguments:
+    - titles: list of strings, the movie titles in the same order as the rows of the neighbour index
+    - neighbour_idx: numpy array of shape (N, k), row positions of the nearest recent movies
+    - neighbour_sims: numpy array of shape (N, k), the corresponding similarities
+
+    Optional arguments:
+    - k: int, number of recommendations per title, defaults to 5
+
+    Returns:
+    - recommendations: dictionary mapping every title to a list of (recommended title, similarity) pairs, sorted
+    from most to least similar and without the title itself
+    """
+    titles = [str(title) for title in titles]
+    recommendations = dict()
+    for title, row_idx, row_sims in zip(titles, neighbour_idx, neighbour_sims):
+        recs = [(titles[idx], round(float(sim), 6)) for idx, sim in zip(row_idx, row_sims)
+                if idx >= 0 and titles[idx] != title]
+        recommendations[title] = recs[:k]
+
+    return recommendations
+
+
+def save_recommendation_table(fs, data_path_recs, recommendations):
+    with fs.open(data_path_recs, "w") as f:
+        json.dump(recommendations, f)
+
+
+def table_movie_recommender(movie_title, recommendations):
+    """
+    Returns the best recommendation for a title from the precomputed table, or None if there is none.
+    """
+    recs = recommendations.get(movie_title)
+    if not recs:
+        return None
+    return recs[0][0]
+
+
+def top_k_recent_movies(query_idx, document_vectors, recent_idx, k=3):
+    """
+    This function scores a batch of query documents against the recent movies only, with one matrix product, and
+    picks the k best recent movies per query with np.argpartition. A query is never recommended to itself.
+
+    Required arguments:
+    - query_idx: array of row positions of the query documents
+    - document_vectors: numpy array of shape (N, num_features), e.g. memory-mapped
+    - recent_idx: array of row positions of the recent movies
+
+    Optional arguments:
+    - k: int, number of recommendations per query, defaults to 3
+
+    Returns:
+    - rec_idx: numpy array of shape (len(query_idx), k), row positions of the recommendations, best first (-1 if
+    there are fewer than k recent movies)
+    - rec_sims: numpy array of shape (len(query_idx), k), the corresponding cosine similarities
+    """
+    query_idx = np.asarray(query_idx, dtype="int64")
+    recent_idx = np.asarray(recent_idx, dtype="int64")
+    queries = normalize_vectors(np.asarray(document_vectors[query_idx], dtype="float64"))
+    recent = normalize_vectors(np.asarray(document_vectors[recent_idx], dtype="float64"))
+
+    # Take one extra neighbour, in case the query is a recent movie itself, and move the query to the end
+    rec_idx, rec_sims = top_k_neighbours(query_vectors=queries, candidate_vectors=recent, candidate_idx=recent_idx,
+                                         k=k + 1)
+    is_self = rec_idx == query_idx[:, None]
+    rec_idx[is_self] = -1
+    order = np.argsort(rec_idx < 0, axis=1, kind="stable")[:, :k]
+
+    return np.take_along_axis(rec_idx, order, axis=1), np.take_along_axis(rec_sims, order, axis=1)
+
+
+def recommend_recent_movies(movie_titles, all_movies_desc, recent_movies_desc, document_vectors, k=3):
+    """
+    This function recommends the k most similar recent movies for each of the given titles, scoring all of them
+    together.
+
+    Required arguments:
+    - movie_titles: list of strings, the query titles
+    - all_movies_desc: pandas dataframe with the original_title of every row of document_vectors
+    - recent_movies_desc: pandas dataframe with the original_title of the movies currently running
+    - document_vectors: numpy array of shape (N, num_features)
+
+    Optional arguments:
+    - k: int, number of recommendations per title, defaults to 3
+
+    Returns:
+    - recommendations: list with one list of (recommended title, similarity) pairs per query title, best first
+    (empty for unknown titles)
+    """
+    all_titles = pd.Index(all_movies_desc["original_title"])
+    query_idx = all_titles.get_indexer(movie_titles)
+    recent_idx = np.flatnonzero(all_titles.isin(recent_movies_desc["original_title"]))
+    known = query_idx >= 0
+
+    recommendations = [[] for _ in movie_titles]
+    if known.any():
+        rec_idx, rec_sims = top_k_recent_movies(query_idx=query_idx[known], document_vectors=document_vectors,
+                                                recent_idx=recent_idx, k=k)
+        for i, row_idx, row_sims in zip(np.flatnonzero(known), rec_idx, rec_sims):
+            recommendations[i] = [(all_titles[idx], float(sim)) for idx, sim in zip(row_idx, row_sims) if idx >= 0]
+
+    return recommendations
 
-    return np.array(features)
 
+def taste_profile_recommender(liked_titles, all_movies_desc, recent_movies_desc, document_vectors,
+                              disliked_titles=(), genres=(), k=3, dislike_weight=0.5, genre_bonus=0.1):
+    """
+    This function recommends recent movies for a taste profile made of several liked and disliked titles. The
+    stored document vectors of the liked titles are averaged, the average of the disliked titles is subtracted,
+    and the resulting query vector is scored against all recent movies in one matrix-vector product. Recent movies
+    with one of the selected genres get a bonus on their score.
+
+    Required arguments:
+    - liked_titles: list of strings, titles the user likes
+    - all_movies_desc: pandas dataframe with the original_title of every row of document_vectors
+    - recent_movies_desc: pandas dataframe with original_title and the "|"-separated genres_string of the movies
+    currently running
+    - document_vectors: numpy array of shape (N, num_features)
+
+    Optional arguments:
+    - disliked_titles: list of strings, titles the user doesn't like, defaults to ()
+    - genres: list of strings, names of the preferred genres, defaults to ()
+    - k: int, number of recommendations, defaults to 3
+    - dislike_weight: float, weight of the disliked titles in the query vector, defaults to 0.5
+    - genre_bonus: float, added to the similarity of recent movies with a preferred genre, defaults to 0.1
+
+    Returns:
+    - recommendations: list of (recommended title, score) pairs, best first
+    """
+    all_titles = pd.Index(all_movies_desc["original_title"])
+    liked_idx = all_titles.get_indexer(list(liked_titles))
+    liked_idx = liked_idx[liked_idx >= 0]
+    disliked_idx = all_titles.get_indexer(list(disliked_titles))
+    disliked_idx = disliked_idx[disliked_idx >= 0]
+    if not len(liked_idx) and not len(disliked_idx) and not genres:
+        return []
+
+    # Combine the profile into a single query vector
+    query = np.zeros(document_vectors.shape[1], dtype="float64")
+    if len(liked_idx):
+        query += normalize_vectors(np.asarray(document_vectors[liked_idx], dtype="float64")).mean(axis=0)
+    if len(disliked_idx):
+        query -= dislike_weight * normalize_vectors(np.asarray(document_vectors[disliked_idx],
+                                                               dtype="float64")).mean(axis=0)
+    query_norm = np.linalg.norm(query)
+    if query_norm:
+        query /= query_norm
 
-def calc_cosine_similarity(corpus, model, num_features):
-    document_vectors = averaged_word2vec_vectorizer(corpus=corpus, model=model, num_features=num_features)
-    doc_similarities = pd.DataFrame(cosine_similarity(document_vectors))
+    # Score the recent movies that aren't part of the profile
+    recent_idx = np.flatnonzero(all_titles.isin(recent_movies_desc["original_title"]))
+    recent_idx = np.setdiff1d(recent_idx, np.concatenate([liked_idx, disliked_idx]))
+    recent = normalize_vectors(np.asarray(document_vectors[recent_idx], dtype="float64"))
+    scores = recent @ query
 
-    return doc_similarities
+    if genres:
+        recent_genres = recent_movies_desc.drop_duplicates("original_title").set_index("original_title")[
+            "genres_string"].reindex(all_titles[recent_idx]).fillna("")
+        wanted_genres = set(genres)
+        has_genre = np.array([bool(wanted_genres.intersection(genre_string.split("|")))
+                              for genre_string in recent_genres])
+        scores = scores + genre_bonus * has_genre
 
+    num_recs = min(k, len(recent_idx))
+    if not num_recs:
+        return []
+    top = np.argpartition(-scores, num_recs - 1)[:num_recs]
+    top = top[np.argsort(-scores[top])]
 
-def recent_movie_recommender(movie_title, all_movies_desc, recent_movies_desc, similarities_df):
-    all_movies = all_movies_desc['original_title'].values
-    recent_movies = recent_movies_desc["original_title"].values
-    recent_movie_idx = all_movies_desc[all_movies_desc["original_title"].isin(recent_movies)].index
-    movie_idx = np.where(all_movies == movie_title)[0][0]
-    movie_similarities = similarities_df.iloc[movie_idx].values
-    similar_movies = np.argsort(-movie_similarities)
-    similar_recent_movies = [index for index in similar_movies if index in recent_movie_idx]
-    movie_rec = all_movies[similar_recent_movies][0]
-    if movie_rec == movie_title:
-        movie_rec = all_movies[similar_recent_movies][1]
-    return movie_rec
+    return [(all_titles[recent_idx[i]], float(scores[i])) for i in top]
@@ -3,10 +3,12 @@ import pandas as pd
 from datetime import date
 
 import visualization.plotting_functions as pf
+from data.showtimes_query import movies_by_hour
 import models.reco_functions as rf
 
 
-def create_app(cineman_df, movie_desc, all_movies_desc, similarities_df, MAPBOX_ACCESS_TOKEN):
+def create_app(dataset_version, cineman_df, showtimes_index, movie_desc, overview_store, all_movies_desc,
+               recommendations, document_vectors, MAPBOX_ACCESS_TOKEN):
     # Header
     st.title(f"Movies in Zurich, {date.today()}")
 
@@ -16,11 +18,33 @@ def create_app(cineman_df, movie_desc, all_movies_desc, similarities_df, MAPBOX_
     favorite_movie = st.sidebar.selectbox("What is your favorite movie?", options=all_movies)
     selected_movie = "All"
 
-    if favorite_movie != "None":
-        movie_rec = rf.recent_movie_recommender(movie_title=favorite_movie, all_movies_desc=all_movies_desc,
-                                                recent_movies_desc=movie_desc, similarities_df=similarities_df)
+    # Several liked and disliked movies and genres can be combined into a taste profile instead
+    with st.sidebar.expander("Or combine several movies and genres"):
+        liked_movies = st.multiselect("Movies you like", options=all_movies[1:])
+        disliked_movies = st.multiselect("Movies you don't like", options=all_movies[1:])
+        genre_options = sorted({genre for genre_string in movie_desc["genres_string"].fillna("")
+                                for genre in genre_string.split("|") if genre})
+        liked_genres = st.multiselect("Genres you like", options=genre_options)
+
+    if liked_movies or disliked_movies or liked_genres:
+        profile_recs = rf.taste_profile_recommender(liked_titles=liked_movies, all_movies_desc=all_movies_desc,
+                                                    recent_movies_desc=movie_desc, document_vectors=document_vectors,
+                                                    disliked_titles=disliked_movies, genres=liked_genres, k=1)
+        movie_rec = profile_recs[0][0] if profile_recs else None
+    elif favorite_movie != "None":
+        movie_rec = rf.table_movie_recommender(movie_title=favorite_movie, recommendations=recommendations)
+        # Titles that aren't in today's table are scored online
+        if movie_rec is None:
+            online_recs = rf.recommend_recent_movies(movie_titles=[favorite_movie], all_movies_desc=all_movies_desc,
+                                                     recent_movies_desc=movie_desc,
+                                                     document_vectors=document_vectors, k=1)[0]
+            movie_rec = online_recs[0][0] if online_recs else None
+    else:
+        movie_rec = None
+
+    if movie_rec is not None:
         st.sidebar.write(f"<b>Recommended Movie:</b><br>{movie_rec}", unsafe_allow_html=True)
-        overview = pf.fetch_movie_desc(movie_desc, movie_rec)
+        overview = pf.fetch_movie_desc(movie_desc, movie_rec, overview_store=overview_store)
         st.sidebar.markdown(f'{overview}', unsafe_allow_html=True)
         selected_movie = movie_rec
 
@@ -28,14 +52,13 @@ def create_app(cineman_df, movie_desc, all_movies_desc, similarities_df, MAPBOX_
     # Select the timeframe
     hours = ["All", "9-12am", "12-3pm", "3-6pm", "6-9pm", "9-12pm"]
     selected_hour = st.sidebar.select_slider("Show movies that start between:", options=hours)
-    cineman_df_hour = pf.select_by_hour(cineman_df, hour=selected_hour)
 
     # Select a specific movie
-    recent_movies = ["All"]+sorted(pd.unique(cineman_df_hour['movie']))
+    recent_movies = ["All"] + movies_by_hour(showtimes_index, hour=selected_hour)
     movie_choice = st.sidebar.selectbox("Choose a Movie", options=recent_movies)
 
     # Add the movie description
-    overview = pf.fetch_movie_desc(movie_desc, movie_choice)
+    overview = pf.fetch_movie_desc(movie_desc, movie_choice, overview_store=overview_store)
     st.sidebar.markdown(f'{overview}', unsafe_allow_html=True)
     if movie_choice != "All":
         selected_movie = movie_choice
@@ -44,7 +67,8 @@ def create_app(cineman_df, movie_desc, all_movies_desc, similarities_df, MAPBOX_
     left, right = st.columns([2, 1])
 
     # Create the map
-    plotly_map = pf.create_plotly_map(df=cineman_df_hour, MAPBOX_ACCESS_TOKEN=MAPBOX_ACCESS_TOKEN,
+    plotly_map = pf.cached_plotly_map(dataset_version=dataset_version, df=cineman_df,
+                                      showtimes_index=showtimes_index, MAPBOX_ACCESS_TOKEN=MAPBOX_ACCESS_TOKEN,
                                       hour=selected_hour, movie=selected_movie)
     left.plotly_chart(plotly_map)
 
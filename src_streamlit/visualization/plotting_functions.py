@@ -1,8 +1,18 @@
 import pandas as pd
 import plotly.graph_objects as go
+import threading
+from collections import OrderedDict
 
+from data.showtimes_query import HOUR_LABELS, HOUR_TO_BUCKET, query_showtimes
 
-def select_by_hour(df, hour="All"):
+
+# Maps shared by all sessions, keyed by (dataset version, hour, movie) and evicted least recently used first
+MAP_CACHE_MAX_ENTRIES = 128
+map_cache = OrderedDict()
+map_cache_lock = threading.Lock()
+
+
+def select_by_hour(df, hour="All", showtimes_index=None):
     """
     This function takes in a string designating a time window and returns instances from a dataframe which fall
     within this time window.
@@ -13,28 +23,48 @@ def select_by_hour(df, hour="All"):
     Optional argument:
     - hour: string, designates a time window; valid options are: "All", "9-12am", "12-3pm", "3-6pm", "6-9pm", "9-12pm".
     Defaults to "All".
+    - showtimes_index: dictionary built by build_showtimes_index for df; if given, the rows are looked up instead of
+    compared. Defaults to None.
 
     Returns:
     - df: pandas dataframe, the same as was fed into the function, but filtered to contain only those occurrences
     where the showtime is within the designated time window.
     """
+    if showtimes_index is not None:
+        return query_showtimes(df, showtimes_index, hour=hour)
     if hour == "All":
-        df = df
-    elif hour == "9-12am":
-        df = df[df["dt_showtime"].between('09:00:00', '12:00:00')]
-    elif hour == "12-3pm":
-        df = df[df["dt_showtime"].between('12:00:00', '15:00:00')]
-    elif hour == "3-6pm":
-        df = df[df["dt_showtime"].between('15:00:00', '18:00:00')]
-    elif hour == "6-9pm":
-        df = df[df["dt_showtime"].between('18:00:00', '21:00:00')]
-    else:
-        df = df[df["dt_showtime"].between('21:00:00', '23:59:00')]
+        return df
+
+    # Compare the time window of each showtime's hour, so the date of the showtime doesn't matter
+    hours = pd.to_datetime(df["dt_showtime"]).dt.hour.to_numpy()
+    df = df[HOUR_TO_BUCKET[hours] == HOUR_LABELS.index(hour)]
 
     return df
 
 
-def fetch_movie_desc(df, movie):
+def build_overview_store(df):
+    """
+    This function renders the description of every movie once and stores it by title, so the descriptions can be
+    looked up without searching the dataframe.
+
+    Required arguments:
+    - df: pandas dataframe with movie titles and corresponding descriptions
+
+    Returns:
+    - overview_store: dictionary with the movie titles as keys and the html snippets of their descriptions as values;
+    titles without a description are left out
+    """
+    overview_store = {}
+    for title, overview in zip(df["original_title"], df["overview"]):
+        # Like before, the first description of a title is used
+        if title in overview_store:
+            continue
+        overview_store[title] = "" if pd.isnull(overview) else f'<b>Movie Description:</b><br>{overview}'
+
+    return {title: overview for title, overview in overview_store.items() if overview}
+
+
+def fetch_movie_desc(df, movie, overview_store=None):
     """
     This function takes in a dataframe with movie descriptions and a movie title.
     It returns the description for this movie or an empty string, if the description is not available.
@@ -43,22 +73,48 @@ def fetch_movie_desc(df, movie):
     - df: pandas dataframe with movie titles and corresponding descriptions
     - movie: string, a movie title
 
+    Optional arguments:
+    - overview_store: dictionary built by build_overview_store for df; if given, the description is looked up in it
+    instead of the dataframe. Defaults to None.
+
     Returns:
     - overview: a string, the movie description corresponding to the movie title.
     """
-    if movie in list(df["original_title"]):
-        overview = df[df["original_title"] == movie]["overview"].values[0]
-        if pd.isnull(overview):
-            overview = ""
-        else:
-            overview = f'<b>Movie Description:</b><br>{overview}'
-    else:
-        overview = ""
-    return overview
+    if overview_store is None:
+        overview_store = build_overview_store(df)
+
+    return overview_store.get(movie, "")
+
+
+def aggregate_by_cinema(df):
+    """
+    This function combines the showtimes of each cinema into one row, so the map gets a single marker per cinema
+    instead of one marker per showtime stacked at the same coordinates.
+
+    Required arguments:
+    - df: pandas dataframe, contains the showtimes with cinema, movie and coordinates
+
+    Returns:
+    - cinemas_df: pandas dataframe with one row per cinema, its coordinates and a hover text with the number of
+    showtimes and the titles of the movies
+    """
+    cinemas = []
+    for _, cinema_df in df.groupby("cinema_place", observed=True, sort=True):
+        cinema = cinema_df["cinema"].iloc[0]
+        titles = sorted(pd.unique(cinema_df["movie"]))
+        count = len(cinema_df)
+        cinemas.append({
+            "cinema": cinema,
+            "latitude": cinema_df["latitude"].iloc[0],
+            "longitude": cinema_df["longitude"].iloc[0],
+            "hover_text": f'<b>{cinema}</b><br>{count} showtime{"s" if count > 1 else ""}<br>' + "<br>".join(titles)
+        })
+
+    return pd.DataFrame(cinemas, columns=["cinema", "latitude", "longitude", "hover_text"])
 
 
 # Plotly scattermapbox
-def create_plotly_map(df, MAPBOX_ACCESS_TOKEN, hour="All", movie="All"):
+def create_plotly_map(df, MAPBOX_ACCESS_TOKEN, hour="All", movie="All", showtimes_index=None):
     """
     This function accepts a dataframe and three other arguments and returns a plotly map for Zurich.
     The longitude and latitude values in the dataframe are used to create a scatter plot.
@@ -70,25 +126,29 @@ def create_plotly_map(df, MAPBOX_ACCESS_TOKEN, hour="All", movie="All"):
     - hour: string, designates a time window; valid options are: "All", "9-12am", "12-3pm", "3-6pm", "6-9pm", "9-12pm".
     Defaults to "All".
     - movie: string, a movie title
+    - showtimes_index: dictionary built by build_showtimes_index for df; if given, both filters are resolved with a
+    single lookup. Defaults to None.
 
     Returns:
     - fig: plotly figure that can be used for plotting
     """
-    df = select_by_hour(df, hour=hour)
-
-    if movie == "All":
-        df = df
+    if showtimes_index is not None:
+        df = query_showtimes(df, showtimes_index, hour=hour, movie=movie)
     else:
-        df = df[df["movie"] == movie]
+        df = select_by_hour(df, hour=hour)
+        if movie != "All":
+            df = df[df["movie"] == movie]
+
+    cinemas_df = aggregate_by_cinema(df)
 
     fig = go.Figure(go.Scattermapbox(
-        lat=df["latitude"],
-        lon=df["longitude"],
+        lat=cinemas_df["latitude"],
+        lon=cinemas_df["longitude"],
         mode='markers',
         marker=go.scattermapbox.Marker(
             size=10, color="crimson"
         ),
-        text=df["cinema"],
+        text=cinemas_df["hover_text"],
         hoverinfo="text"
     ))
 
@@ -108,3 +168,38 @@ def create_plotly_map(df, MAPBOX_ACCESS_TOKEN, hour="All", movie="All"):
         )
     )
     return fig
+
+
+def cached_plotly_map(dataset_version, df, showtimes_index, MAPBOX_ACCESS_TOKEN, hour="All", movie="All"):
+    """
+    This function returns the map of create_plotly_map for a filter state, building it only the first time the state
+    is requested for a dataset. The figures are shared by all sessions, so they must not be modified.
+
+    Required arguments:
+    - dataset_version: string, identifies the loaded showtimes (e.g. the date of the data)
+    - df: pandas dataframe, contains the data on movies and cinemas to be plotted.
+    - showtimes_index: dictionary built by build_showtimes_index for df
+    - access_token: a mapbox access token required for the customization of the map.
+
+    Optional arguments:
+    - hour: string, designates a time window, defaults to "All"
+    - movie: string, a movie title, defaults to "All"
+
+    Returns:
+    - fig: plotly figure that can be used for plotting
+    """
+    key = (dataset_version, hour, movie)
+    with map_cache_lock:
+        if key in map_cache:
+            map_cache.move_to_end(key)
+            return map_cache[key]
+
+    fig = create_plotly_map(df, MAPBOX_ACCESS_TOKEN, hour=hour, movie=movie, showtimes_index=showtimes_index)
+
+    with map_cache_lock:
+        map_cache[key] = fig
+        map_cache.move_to_end(key)
+        while len(map_cache) > MAP_CACHE_MAX_ENTRIES:
+            map_cache.popitem(last=False)
+
+    return fig